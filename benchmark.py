@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+import argparse
+import ast
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import corpus_gen
+import script
+
+"""
+Benchmarks for the JSON -> docx conversion in script.py.
+
+Without arguments, generates synthetic corpora (see corpus_gen.py) of
+increasing text length, times loading, parsing and saving at each size and
+flags stages whose time per line grows with the text length, eg.
+    python benchmark.py --sizes 50,200,800,3200
+
+Run on a corpusjson directory (or a single JSON) to compare the writers
+(including the txt/html/jsonl preview formats), eg.
+    python benchmark.py --file /path/to/json/saao/saa19/corpusjson
+
+Compare the installed JSON decoding backends on catalogue-sized inputs with
+    python benchmark.py --decoders
+
+Check that --stream-json walks texts the same as the in-memory walk with
+    python benchmark.py --check-stream
+and that verbose messages of parallel conversions stay grouped per text with
+    python benchmark.py --check-verbose
+
+Time parsing and saving without -v against a copy of script.py with every
+verbose message taken out, ie. what the messages cost when they're off, with
+    python benchmark.py --logging
+"""
+
+# Stages whose cost grows faster than this power of the number of lines are flagged
+SCALING_TOLERANCE = 1.25
+
+
+def _parse_streams(path):
+    """Parses every text under path into TokenStreams, without saving anything.
+    Incomplete texts aren't scraped (the page cache is in-memory and offline).
+    Returns:
+        list (TokenStream)
+    """
+    loader = script.JsonLoader(path, lazy=True, catalogues=script.CatalogueRegistry(None))
+    pages = script.PageCache(None, offline=True)
+    streams = []
+    for json_dict in loader.iter_json_dicts():
+        if not json_dict.get("textid"):
+            continue
+        stream = script.TokenStream()
+        script.JsonParser(json_dict, ".", pages=pages).parse_json(stream)
+        streams.append(stream)
+    return streams
+
+
+def bench_writers(streams, repeat):
+    """Times each of script.WRITERS, then each of the script.FORMATS
+    writers, writing every stream to memory.
+    """
+    n_runs = sum(len(stream.texts) for stream in streams)
+    n_runs_added = sum(stream.runs_added for stream in streams)
+    print("Writers: {0} document(s), {1} run(s) ({2} before coalescing), best of {3}".format(
+        len(streams), n_runs, n_runs_added, repeat))
+    results = {}
+    writers = [(name, script.WRITERS[name]) for name in sorted(script.WRITERS)]
+    writers += [(name, script.FORMATS[name]) for name in sorted(script.FORMATS)]
+    for name, writer_class in writers:
+        writer = writer_class()
+        best = None
+        for _ in range(repeat):
+            total_bytes = 0
+            start = time.perf_counter()
+            for stream in streams:
+                fd = io.BytesIO()
+                writer.write(stream, fd)
+                total_bytes += fd.tell()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+        print("  {0:<12} {1:8.3f}s  {2:8.1f} docs/s  {3:10.0f} runs/s  {4:6.1f} KB/doc".format(
+            name, best, len(streams) / best, n_runs / best, total_bytes / 1024.0 / max(len(streams), 1)))
+    if "python-docx" in results and "ooxml" in results:
+        print("  ooxml is {0:.1f}x python-docx".format(results["python-docx"] / results["ooxml"]))
+    return results
+
+
+def bench_decoders(repeat, n_members=20000, lines=3200, seed=0):
+    """Times each of script.JSON_BACKENDS decoding a synthetic catalogue.json
+    with n_members entries, one corpusjson text of the given number of lines,
+    and the catalogue's entries one by one (as CatalogueRegistry does).
+    Returns:
+        dict: backend name -> dict (input name -> best time in seconds)
+    """
+    generator = corpus_gen.CorpusGenerator(seed=seed)
+    members = {"X{0:06d}".format(index): generator.make_catalogue_entry(index) for index in range(n_members)}
+    catalogue = json.dumps({"type": "catalogue", "project": "synthetic/syn1", "members": members},
+                           ensure_ascii=False).encode("utf_8")
+    text = json.dumps(generator.make_text("X000000", "synthetic/syn1", lines), ensure_ascii=False).encode("utf_8")
+    entries = [json.dumps(entry, ensure_ascii=False) for entry in members.values()]
+    inputs = [
+        ("catalogue", len(catalogue), lambda loads: loads(catalogue)),
+        ("corpusjson", len(text), lambda loads: loads(text)),
+        ("entries", sum(len(entry) for entry in entries), lambda loads: [loads(entry) for entry in entries]),
+    ]
+
+    print("Decoders: catalogue of {0} members ({1:.1f} MB), text of {2} lines ({3:.1f} MB), best of {4}".format(
+        n_members, len(catalogue) / 1e6, lines, len(text) / 1e6, repeat))
+    results = {}
+    for name in sorted(script.JSON_BACKENDS):
+        loads = script.JSON_BACKENDS[name]
+        results[name] = {}
+        for input_name, size, decode in inputs:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                decode(loads)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name][input_name] = best
+            print("  {0:<8} {1:<11} {2:8.1f} ms {3:8.1f} MB/s".format(name, input_name, 1000 * best, size / 1e6 / best))
+    for name in sorted(results):
+        if name != "json":
+            print("  {0} speedup over json: {1}".format(name, ", ".join(
+                "{0:.1f}x on {1}".format(results["json"][input_name] / results[name][input_name], input_name)
+                for input_name, size, decode in inputs)))
+    if len(results) == 1:
+        print("  (only json is installed; pip install orjson to compare)")
+    return results
+
+
+def _odd_c_nodes(textid, rng):
+    """C-node shapes that ORACC texts don't usually have but the parser must
+    still walk the same way streamed or not: no cdl, no cdl and no id, "cdl"
+    before "node", an empty or null cdl, and one nested in another.
+    """
+    lemma = {"node": "l", "frag": "KUR", "id": textid + ".x", "ref": textid + ".x", "inst": "x",
+             "f": {"lang": "akk", "form": "KUR", "delim": " ", "gdl": [{"s": "KUR", "role": "logo"}], "pos": "N"}}
+    shapes = [
+        {"node": "c", "type": "phrase", "id": textid + ".odd1"},
+        {"node": "c", "type": "phrase"},
+        {"cdl": [dict(lemma)], "node": "c", "type": "phrase", "id": textid + ".odd2"},
+        {"node": "c", "type": "phrase", "id": textid + ".odd3", "cdl": []},
+        {"node": "c", "type": "phrase", "id": textid + ".odd4", "cdl": None},
+        {"node": "c", "type": "phrase", "id": textid + ".odd5",
+         "cdl": [{"node": "c", "type": "phrase"}, dict(lemma)]},
+    ]
+    return [rng.choice(shapes) for _ in range(rng.randint(1, 4))]
+
+
+def _strip_cdl(node):
+    return {key: value for key, value in node.items() if key != "cdl"}
+
+
+def check_cdl_reader(n_texts=20, lines=60, seed=0):
+    """Checks that script.CdlReader.events() gives the same events as
+    script.walk_cdl() on the same text, and that JsonParser makes the same
+    paragraphs from either, on synthetic texts with _odd_c_nodes() mixed in.
+    Texts are read a few characters at a time so values straddle chunks.
+    Returns:
+        int: number of texts that differ
+    """
+    rng = random.Random(seed)
+    generator = corpus_gen.CorpusGenerator(seed=seed)
+    pages = script.PageCache(None, offline=True)
+    n_differ = 0
+    for index in range(n_texts):
+        textid = "X{0:06d}".format(index)
+        text = generator.make_text(textid, "synthetic/syn1", lines)
+        body = text["cdl"][0]["cdl"][0]["cdl"]
+        for _ in range(5):
+            position = rng.randint(0, len(body))
+            body[position:position] = _odd_c_nodes(textid, rng)
+        if index % 2:  # "cdl" before "node" in the top-level C-node too
+            text["cdl"][0] = dict(cdl=text["cdl"][0]["cdl"], **_strip_cdl(text["cdl"][0]))
+
+        expected = [(kind, _strip_cdl(node)) for kind, node in script.walk_cdl(text["cdl"])]
+        reader = script.CdlReader(io.StringIO(json.dumps(text, ensure_ascii=False)), chunk_size=7)
+        header = reader.read_header()
+        actual = [(kind, _strip_cdl(node)) for kind, node in reader.events()]
+
+        paragraphs = []
+        for json_dict in (text, script.CdlReader(io.StringIO(json.dumps(text)), chunk_size=7).read_header()):
+            stream = script.TokenStream()
+            with contextlib.redirect_stdout(io.StringIO()):
+                script.JsonParser(dict(json_dict, docx_name=textid), ".", pages=pages).parse_json(stream)
+            paragraphs.append([stream.paragraph_text(i) for i in range(len(stream))])
+
+        if expected != actual or paragraphs[0] != paragraphs[1] or header.get("textid") != textid:
+            n_differ += 1
+            if n_differ <= 5:
+                print("  differs: {0} ({1} events in memory, {2} streamed)".format(textid, len(expected), len(actual)))
+    print("CdlReader: {0} text(s), {1} differ from walk_cdl()".format(n_texts, n_differ))
+    return n_differ
+
+
+def _time_stages(corpus_path, output_directory, repeat, module=script):
+    """Times JsonLoader, JsonParser.parse_json and JsonParser.save_docx over
+    every text in corpus_path. The catalogue is indexed before timing starts.
+    Args:
+        module (module): script, or a copy of it (see _unlogged_script())
+    Returns:
+        dict: stage name -> best total time in seconds
+    """
+    catalogues = module.CatalogueRegistry(None)
+    catalogues.ensure_indexed(module.CatalogueRegistry.project_path_for(
+        os.path.join(corpus_path, "X.json")))
+    pages = module.PageCache(None, offline=True)
+    best = {}
+    for _ in range(repeat):
+        timings = {"load": 0.0, "parse": 0.0, "save": 0.0}
+        loader = module.JsonLoader(corpus_path, lazy=True, catalogues=catalogues)
+        json_dicts = loader.iter_json_dicts()
+        while True:
+            start = time.perf_counter()
+            json_dict = next(json_dicts, None)
+            timings["load"] += time.perf_counter() - start
+            if json_dict is None:
+                break
+
+            jp = module.JsonParser(json_dict, output_directory, pages=pages)
+            stream = module.TokenStream()
+            start = time.perf_counter()
+            jp.parse_json(stream)
+            timings["parse"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                jp.save_docx(stream)
+            timings["save"] += time.perf_counter() - start
+        for stage, elapsed in timings.items():
+            best[stage] = min(best.get(stage, elapsed), elapsed)
+    return best
+
+
+def bench_scaling(sizes, n_texts, repeat, seed=0, keep=None, **options):
+    """Generates a synthetic corpus of n_texts texts for each number of lines in
+    sizes, and times each stage on it. A stage is flagged when its time grows
+    faster than linearly in the number of lines between the smallest and the
+    largest size (eg. a membership check on a list of every ref seen so far).
+    Returns:
+        dict: number of lines -> dict (stage name -> best total time in seconds)
+    """
+    sizes = sorted(sizes)
+    oracc_path = keep or tempfile.mkdtemp(prefix="oracc-bench-")
+    output_directory = tempfile.mkdtemp(prefix="oracc-bench-out-")
+    results = {}
+    try:
+        print("Scaling: {0} text(s) per size, best of {1}".format(n_texts, repeat))
+        print("  {0:>6} {1:>12} {2:>12} {3:>12}   (ms/text; us/line)".format("lines", "load", "parse", "save"))
+        for lines in sizes:
+            corpus_path = corpus_gen.write_project(oracc_path, "synthetic/lines{0}".format(lines), n_texts, lines,
+                                                   seed=seed, **options)
+            results[lines] = _time_stages(corpus_path, output_directory, repeat)
+            print("  {0:>6} {1}".format(lines, " ".join(
+                "{0:6.1f};{1:5.1f}".format(1000.0 * results[lines][stage] / n_texts,
+                                          1e6 * results[lines][stage] / (n_texts * lines))
+                for stage in ("load", "parse", "save"))))
+    finally:
+        shutil.rmtree(output_directory, ignore_errors=True)
+        if keep is None:
+            shutil.rmtree(oracc_path, ignore_errors=True)
+
+    if len(sizes) > 1:
+        smallest, largest = sizes[0], sizes[-1]
+        for stage in ("load", "parse", "save"):
+            exponent = math.log(results[largest][stage] / results[smallest][stage]) / math.log(largest / smallest)
+            flag = "  <-- SUPER-LINEAR" if exponent > SCALING_TOLERANCE else ""
+            print("  {0:<6} grows as lines^{1:.2f}{2}".format(stage, exponent, flag))
+    return results
+
+
+class _DebugStripper(ast.NodeTransformer):
+    """Replaces every logger.debug() call, and every `if self.verbose:` block
+    guarding some, with pass.
+    """
+    def visit_Expr(self, node):
+        call = node.value
+        if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == "debug"
+                and isinstance(call.func.value, ast.Name) and call.func.value.id == "logger"):
+            return ast.copy_location(ast.Pass(), node)
+        return node
+
+    def visit_If(self, node):
+        test = node.test
+        if (isinstance(test, ast.Attribute) and test.attr == "verbose"
+                and isinstance(test.value, ast.Name) and test.value.id == "self" and not node.orelse):
+            return ast.copy_location(ast.Pass(), node)
+        return self.generic_visit(node)
+
+
+def _unlogged_script():
+    """Compiles a copy of script.py without its verbose messages, as the
+    reference for what a quiet run would cost if they weren't there at all.
+    Returns:
+        module
+    """
+    with open(script.__file__, encoding="utf_8") as fd:
+        tree = _DebugStripper().visit(ast.parse(fd.read(), script.__file__))
+    module = types.ModuleType("script_unlogged")
+    module.__file__ = script.__file__
+    exec(compile(ast.fix_missing_locations(tree), script.__file__, "exec"), module.__dict__)
+    return module
+
+
+def bench_logging(n_texts, lines, repeat, seed=0, **options):
+    """Times parsing and saving a synthetic corpus three ways, taking turns
+    between them on every repeat: script as run without -v, a copy of script
+    without any verbose messages, and script with -v (its messages thrown away).
+    Returns:
+        dict: "quiet", "unlogged" or "verbose" -> dict (stage name -> best total time in seconds)
+    """
+    unlogged = _unlogged_script()
+    oracc_path = tempfile.mkdtemp(prefix="oracc-bench-")
+    output_directory = tempfile.mkdtemp(prefix="oracc-bench-out-")
+    results = {}
+    try:
+        corpus_path = corpus_gen.write_project(oracc_path, "synthetic/logging", n_texts, lines, seed=seed, **options)
+        for _ in range(repeat):
+            for name, module, verbose in (("quiet", script, False), ("unlogged", unlogged, False),
+                                          ("verbose", script, True)):
+                script.configure_logging(verbose)
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    timings = _time_stages(corpus_path, output_directory, 1, module=module)
+                best = results.setdefault(name, timings)
+                for stage, elapsed in timings.items():
+                    best[stage] = min(best[stage], elapsed)
+    finally:
+        script.configure_logging(False)
+        shutil.rmtree(output_directory, ignore_errors=True)
+        shutil.rmtree(oracc_path, ignore_errors=True)
+
+    print("Logging: {0} text(s) of {1} lines, best of {2} (ms/text)".format(n_texts, lines, repeat))
+    print("  {0:<9} {1:>8} {2:>8} {3:>8}".format("", "parse", "save", "total"))
+    for name in ("unlogged", "quiet", "verbose"):
+        timings = results[name]
+        print("  {0:<9} {1:8.2f} {2:8.2f} {3:8.2f}".format(
+            name, 1000.0 * timings["parse"] / n_texts, 1000.0 * timings["save"] / n_texts,
+            1000.0 * (timings["parse"] + timings["save"]) / n_texts))
+    reference = results["unlogged"]
+    for name in ("quiet", "verbose"):
+        timings = results[name]
+        print("  {0} over unlogged: parse {1:+.1%}, total {2:+.1%}".format(
+            name, timings["parse"] / reference["parse"] - 1,
+            (timings["parse"] + timings["save"]) / (reference["parse"] + reference["save"]) - 1))
+    return results
+
+
+def check_verbose_grouping(jobs=4, n_texts=8, lines=100, seed=0):
+    """Runs script.py -v -j jobs on a synthetic corpus and checks that every
+    text's verbose messages come out in one block: each line mentioning a
+    textid has to be inside the block started by that text's "Parsing
+    textid" line.
+    Returns:
+        int: number of lines outside their text's block
+    """
+    oracc_path = tempfile.mkdtemp(prefix="oracc-bench-")
+    try:
+        corpus_path = corpus_gen.write_project(oracc_path, "synthetic/verbose", n_texts, lines, seed=seed)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(script.__file__), "--file", corpus_path, "--verbose", "--jobs", str(jobs),
+             "--offline", "--format", "txt", "--output-directory", os.path.join(oracc_path, "out"),
+             "--cache-directory", os.path.join(oracc_path, "cache")],
+            stdout=subprocess.PIPE, check=True).stdout.decode("utf_8")
+    finally:
+        shutil.rmtree(oracc_path, ignore_errors=True)
+
+    textid_re = re.compile(r"X\d{6}")
+    block = None
+    blocks = set()
+    n_stray = 0
+    for line in output.splitlines():
+        if line.startswith("Parsing textid "):
+            block = textid_re.search(line).group(0)
+            blocks.add(block)
+            continue
+        for textid in set(textid_re.findall(line)):
+            if textid != block:
+                n_stray += 1
+                if n_stray <= 5:
+                    print("  outside its block: {0!r}".format(line[:100]))
+    print("Verbose output: {0} of {1} text(s) reported, {2} line(s) outside their text's block".format(
+        len(blocks), n_texts, n_stray))
+    return n_stray + n_texts - len(blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks conversion of ORACC JSON to docx.")
+    parser.add_argument('--file', '-f', required=False,
+                        help="A path (file or directory) to the JSON file(s) to compare the writers with. "
+                             "When omitted, benchmarks scaling on synthetic corpora instead.")
+    parser.add_argument('--repeat', '-r', required=False, action="store", type=int, default=3,
+                        help="Number of times to repeat each measurement; the best time is reported. Defaults to 3.")
+    parser.add_argument('--sizes', required=False, action="store", default="50,200,800,3200",
+                        help="Comma separated numbers of lines per synthetic text. Defaults to 50,200,800,3200.")
+    parser.add_argument('--texts', '-n', required=False, action="store", type=int, default=5,
+                        help="Number of synthetic texts per size. Defaults to 5.")
+    parser.add_argument('--seed', required=False, action="store", type=int, default=0,
+                        help="Random seed for the synthetic corpora. Defaults to 0.")
+    parser.add_argument('--decoders', required=False, action="store_true",
+                        help="Compare the installed JSON decoding backends instead")
+    parser.add_argument('--check-stream', required=False, action="store_true",
+                        help="Check that --stream-json walks texts the same as the in-memory walk instead")
+    parser.add_argument('--check-verbose', required=False, action="store_true",
+                        help="Check that script.py -v -j 4 reports each text's messages in one block instead")
+    parser.add_argument('--logging', required=False, action="store_true",
+                        help="Time parsing and saving without -v against script.py with its verbose messages "
+                             "taken out instead, on --texts synthetic texts of the largest of --sizes lines")
+    parser.add_argument('--keep', required=False, action="store",
+                        help="Directory to write the synthetic corpora to and keep, instead of a temporary one")
+    for option, default in sorted(corpus_gen.DEFAULT_OPTIONS.items()):
+        parser.add_argument('--' + option, required=False, action="store", type=type(default), default=default,
+                            help="Synthetic corpus option, see corpus_gen.py. Defaults to {0}.".format(default))
+    args = parser.parse_args()
+
+    if args.decoders:
+        bench_decoders(args.repeat, seed=args.seed)
+        return
+    if args.check_stream:
+        sys.exit(1 if check_cdl_reader(seed=args.seed) else 0)
+    if args.check_verbose:
+        sys.exit(1 if check_verbose_grouping(seed=args.seed) else 0)
+    if args.logging:
+        options = {option: getattr(args, option) for option in corpus_gen.DEFAULT_OPTIONS}
+        sizes = [int(size) for size in args.sizes.split(",")]
+        bench_logging(args.texts, max(sizes), args.repeat, seed=args.seed, **options)
+        return
+    if args.file:
+        streams = _parse_streams(args.file)
+        bench_writers(streams, args.repeat)
+        return
+
+    options = {option: getattr(args, option) for option in corpus_gen.DEFAULT_OPTIONS}
+    sizes = [int(size) for size in args.sizes.split(",")]
+    bench_scaling(sizes, args.texts, args.repeat, seed=args.seed, keep=args.keep, **options)
+
+
+if __name__ == "__main__":
+    main()
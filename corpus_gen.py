@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+
+"""
+Generates synthetic ORACC projects (corpusjson/*.json plus catalogue.json)
+shaped like the real ones, for benchmarking script.py without a checkout of
+https://github.com/oracc/json. eg.
+    python corpus_gen.py --output /tmp/oracc --project rinap/rinap9 --texts 20 --lines 400
+
+Texts have obverse/reverse sections, sentences nested as deep as asked,
+syllables, logograms, determinatives, logogram clusters (incl. ligatures),
+numbers, ellipses, mods, qualified and composite signs, breakage markers,
+excised D-nodes, punctuation and Aramaic fragments.
+"""
+
+SYLLABLES = ["a", "ba", "bi₂", "tu", "ša₂", "ru", "ka", "li", "iš", "um", "ma", "ni", "ṣa", "ṭu", "ḫi", "qa", "ši", "e₃", "u₂"]
+LOGOGRAMS = ["LUGAL", "KUR", "MEŠ", "DINGIR", "E₂", "GAL", "DUMU", "URU", "AN", "KI", "GIŠ", "NA₄"]
+DETERMINATIVES = ["d", "m", "f", "KUR", "URU", "GIŠ", "LU₂", "KI"]
+NUMBERS = ["1", "4", "1/2", "2/3", "10"]
+EXCISED_FRAGS = ["<<BU>>", "{<<d}60>>", "{uru}arba-il₃", "<ša₂>"]
+ARAMAIC_FRAGS = ["mnn", "brk-ʾl", "šmš 12"]
+
+DEFAULT_OPTIONS = {
+    "depth": 2,  # levels of nested C-nodes inside each sentence
+    "det": 0.15,  # chance of a gdl node being a determinative
+    "cluster": 0.1,  # chance of a gdl node being a logogram cluster
+    "excised": 0.02,  # chance of a node in a sentence being an excised D-node
+    "aramaic": 0.01,  # chance of an L-node being Aramaic
+    "damage": 0.3,  # scales how often signs get breaks, half brackets, ? and ( )
+}
+
+
+class CorpusGenerator(object):
+    """
+    Class to make synthetic ORACC CDL texts. Output only depends on the seed
+    and options, so benchmarks can be rerun on identical input.
+    """
+    def __init__(self, seed=0, **options):
+        self.rng = random.Random(seed)
+        self.options = dict(DEFAULT_OPTIONS)
+        self.options.update(options)
+
+    def make_text(self, textid, project, lines):
+        """Makes one corpusjson text with (at least) the given number of lines.
+        Returns:
+            dict: same layout as an ORACC corpusjson file
+        """
+        self._unit = 0
+        self._lemma = 0
+        self._line = 0
+        body = [{"node": "d", "type": "obverse", "ref": textid + ".o"}]
+        added_reverse = False
+        while self._line < lines:
+            if not added_reverse and self._line >= lines // 2:
+                body.append({"node": "d", "type": "reverse", "ref": textid + ".r"})
+                added_reverse = True
+            body.append(self._c_node(textid, "sentence", self.options["depth"]))
+        return {
+            "type": "cdl",
+            "project": project,
+            "source": "synthetic",
+            "textid": textid,
+            "cdl": [{
+                "node": "c", "type": "text", "id": textid + ".U0",
+                "cdl": [{"node": "c", "type": "discourse", "subtype": "body", "id": textid + ".U1", "cdl": body}],
+            }],
+        }
+
+    def make_catalogue_entry(self, index):
+        return {
+            "primary_publication": "Synthetic {0:03d}".format(index),
+            "popular_name": "Syn {0}".format(index),
+            "display_name": "Synthetic Syn {0}".format(index),
+            "designation": "Syn {0}".format(index),
+            "museum_no": "BM {0}".format(index) if index % 2 else "IM -",
+            "collection": "British Museum, London, UK",
+            "exemplars": "BM {0}".format(index),
+        }
+
+    def _c_node(self, textid, c_type, depth):
+        rng = self.rng
+        self._unit += 1
+        c_node = {"node": "c", "type": c_type, "id": "{0}.U{1}".format(textid, self._unit + 1), "cdl": []}
+        for _ in range(rng.randint(2, 6)):
+            if depth > 1 and rng.random() < 0.3:
+                c_node["cdl"].append(self._c_node(textid, "phrase", depth - 1))
+                continue
+            r = rng.random()
+            if r < 0.25:
+                self._line += 1
+                c_node["cdl"].append({"node": "d", "type": "line-start", "ref": "{0}.{1}".format(textid, self._line),
+                                      "label": "o {0}".format(self._line)})
+            elif r < 0.25 + self.options["excised"]:
+                c_node["cdl"].append({"node": "d", "type": "excised", "frag": rng.choice(EXCISED_FRAGS), "delim": " "})
+            elif r < 0.28 + self.options["excised"]:
+                c_node["cdl"].append({"node": "d", "type": "punct", "frag": "*", "delim": " "})
+            else:
+                c_node["cdl"].append(self._l_node(textid))
+                if rng.random() < 0.02:  # same ref repeated, which the parser skips
+                    c_node["cdl"].append(dict(c_node["cdl"][-1]))
+        return c_node
+
+    def _l_node(self, textid):
+        rng = self.rng
+        self._lemma += 1
+        ref = "{0}.{1}.{2}".format(textid, self._line, self._lemma)
+        l_id = "{0}.l{1:05x}".format(textid, self._lemma)
+        if rng.random() < self.options["aramaic"]:
+            frag = rng.choice(ARAMAIC_FRAGS)
+            return {"node": "l", "frag": frag, "id": l_id, "ref": ref, "inst": "%arc:" + frag + "=",
+                    "f": {"lang": "arc", "form": frag}}
+        gdl = self._gdl(ref)
+        return {"node": "l", "frag": "x", "id": l_id, "ref": ref, "inst": "x[x]N",
+                "f": {"lang": rng.choice(["akk", "akk-x-neoass", "sux"]), "form": "x", "delim": " ",
+                      "gdl": gdl, "pos": "N"}}
+
+    def _gdl(self, ref):
+        rng = self.rng
+        gdl = []
+        n = rng.randint(1, 4)
+        for i in range(n):
+            sign_id = "{0}.{1}".format(ref, i)
+            r = rng.random()
+            if r < self.options["det"]:
+                det = rng.choice(DETERMINATIVES)
+                seq = {"id": sign_id, "gdl_utf8": "𒀭"}
+                seq["v" if det.islower() else "s"] = det
+                node = {"det": "semantic", "pos": rng.choice(["pre", "post"]), "seq": [seq]}
+                if i + 1 < n and rng.random() < 0.2:  # two determinatives in a row
+                    gdl.append(node)
+                    node = {"det": "semantic", "pos": "pre", "seq": [{"v": "d", "id": sign_id + "b"}]}
+            elif r < self.options["det"] + self.options["cluster"]:
+                group = []
+                for j in range(rng.randint(2, 3)):
+                    member_id = "{0}.{1}".format(sign_id, j)
+                    member = self._damage({"s": rng.choice(LOGOGRAMS), "id": member_id, "role": "logo",
+                                           "logolang": "sux", "gdl_utf8": "𒈗"}, member_id)
+                    member["delim"] = "."
+                    group.append(member)
+                del group[-1]["delim"]
+                if rng.random() < 0.2:  # ligature nested in the cluster
+                    group.append({"gg": "ligature", "group": [{"s": "AN", "role": "logo", "delim": "+"},
+                                                              {"s": "KI", "role": "logo"}]})
+                node = {"gg": "logo", "gdl_type": "logo", "group": group}
+            elif r < 0.55:
+                node = self._damage({"v": rng.choice(SYLLABLES), "id": sign_id, "gdl_utf8": "𒀀"}, sign_id)
+            elif r < 0.75:
+                node = self._damage({"s": rng.choice(LOGOGRAMS), "id": sign_id, "role": "logo",
+                                     "logolang": "sux", "gdl_utf8": "𒈗"}, sign_id)
+            elif r < 0.82:
+                node = self._damage({"n": "n", "form": rng.choice(NUMBERS), "id": sign_id}, sign_id)
+            elif r < 0.87:
+                node = {"x": "ellipsis", "id": sign_id, "breakStart": "1", "breakEnd": "1", "break": "missing"}
+            elif r < 0.91:
+                node = {"mods": [{"b": "v"}], "form": rng.choice(["LU₂~v", "ka~a"]), "id": sign_id}
+            elif r < 0.95:
+                node = {"q": "|KA×A|(ka)", "id": sign_id}
+            else:
+                node = {"c": "|SAL.KUR|", "id": sign_id, "delim": ""}
+            if i + 1 < n and "delim" not in node:
+                node["delim"] = rng.choice(["-", "-", ".", "/"])
+            gdl.append(node)
+        return gdl
+
+    def _damage(self, node, sign_id):
+        """Randomly marks a sign as broken, partially broken, queried or
+        supplied/excised, scaled by the "damage" option.
+        """
+        rng = self.rng
+        p = self.options["damage"]
+        if rng.random() < p * 0.3:
+            node["breakStart"] = "1"
+        if rng.random() < p * 0.3:
+            node["breakEnd"] = "1"
+        if rng.random() < p * 0.2:
+            node["ho"] = "1"
+        if rng.random() < p * 0.2:
+            node["hc"] = "1"
+        if rng.random() < p * 0.1:
+            node["queried"] = "1"
+        if rng.random() < p * 0.1:
+            node["statusStart"] = sign_id
+            node["o"] = rng.choice([")", ">", ">>"])
+        return node
+
+
+def write_project(oracc_path, project, n_texts, lines, seed=0, **options):
+    """Writes a synthetic project in the same layout as the ORACC JSON repo,
+    ie. oracc_path/project/catalogue.json and oracc_path/project/corpusjson/*.json
+    Returns:
+        str: path to the corpusjson directory
+    """
+    generator = CorpusGenerator(seed=seed, **options)
+    corpus_path = os.path.join(oracc_path, project, "corpusjson")
+    if not os.path.isdir(corpus_path):
+        os.makedirs(corpus_path)
+
+    members = {}
+    for index in range(n_texts):
+        textid = "X{0:06d}".format(seed * 10000 + index)
+        with open(os.path.join(corpus_path, textid + ".json"), "w", encoding="utf_8") as fd:
+            json.dump(generator.make_text(textid, project, lines), fd, ensure_ascii=False)
+        members[textid] = generator.make_catalogue_entry(index)
+
+    with open(os.path.join(oracc_path, project, "catalogue.json"), "w", encoding="utf_8") as fd:
+        json.dump({"type": "catalogue", "project": project, "members": members}, fd, ensure_ascii=False)
+    return corpus_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic ORACC project for benchmarking.")
+    parser.add_argument('--output', '-o', required=True,
+                        help="Directory to write the project into, laid out like the ORACC JSON repo")
+    parser.add_argument('--project', '-p', required=False, default="synthetic/syn1",
+                        help="Project path, eg. rinap/rinap9. Defaults to synthetic/syn1.")
+    parser.add_argument('--texts', '-n', required=False, type=int, default=10,
+                        help="Number of texts to generate. Defaults to 10.")
+    parser.add_argument('--lines', '-l', required=False, type=int, default=100,
+                        help="Number of lines per text. Defaults to 100.")
+    parser.add_argument('--seed', required=False, type=int, default=0,
+                        help="Random seed. Defaults to 0.")
+    for option, default in sorted(DEFAULT_OPTIONS.items()):
+        parser.add_argument('--' + option, required=False, type=type(default), default=default,
+                            help="Defaults to {0}.".format(default))
+    args = parser.parse_args()
+
+    options = {option: getattr(args, option) for option in DEFAULT_OPTIONS}
+    corpus_path = write_project(args.output, args.project, args.texts, args.lines, seed=args.seed, **options)
+    print("Wrote {0} text(s) to {1}".format(args.texts, corpus_path))
+
+
+if __name__ == "__main__":
+    main()
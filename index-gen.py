@@ -2,13 +2,16 @@
 import json
 import os
 import argparse
+import multiprocessing
+import zipfile
+import xml.etree.ElementTree as ElementTree
 
-from docx import Document
+from script import CatalogueRegistry, DocxBundle, default_cache_directory
 
 """Tool to generate a flat file with metadata of files for use with autokey.
 Each entry contains:
 - Q, X, or P-number (textid; to be used as English title)
-- absolute path to docx file
+- absolute path to docx file (or with --bundle, to the bundle and the docx's member name in it)
 - size (or # of lines) of file
 - museum/popular/primary name (to be used as an alias)
 - other exemplar/museum info (to be used in description)
@@ -16,129 +19,213 @@ Each entry contains:
 NOTE: will not render unicode on output, but seems to paste just fine...
 """
 
-# These contain your corpusjson folders as well as catalogue.json
-# Your docx folder is also expected to have this folder structure
-folders = [
-    'ribo/babylon6',
-    'ribo/babylon7',
-    'ribo/babylon8',
-    'rinap/rinap1',
-    'rinap/rinap3',
-    'rinap/rinap4',
-    'saao/saa01',
-    'saao/saa05',
-    'saao/saa11',
-    'saao/saa15',
-    'saao/saa16',
-    'saao/saa17',
-    'saao/saa18',
-    'saao/saa19',
-    'suhu'
-]
-
-def _read_catalogue(json_path):
-    with open(json_path) as fd:
-        return json.load(fd)
+WORDML_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def count_paragraphs(docx_path):
+    """Counts the paragraphs of a docx, same as len(Document(docx_path).paragraphs)
+    (ie. only w:p directly in w:body, not eg. ones in tables), but by streaming
+    word/document.xml out of the zip instead of building the whole document.
+    Elements are dropped as soon as they've been seen, so memory use doesn't
+    grow with the size of the document.
+    Args:
+        docx_path (str): path to a docx file
+    Returns:
+        int: number of body paragraphs
+    """
+    n_paragraphs = 0
+    depth = 0
+    body = None
+    with zipfile.ZipFile(docx_path) as docx, docx.open("word/document.xml") as fd:
+        for event, element in ElementTree.iterparse(fd, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2 and element.tag == WORDML_NS + "body":
+                    body = element
+                continue
+            depth -= 1
+            if depth == 2 and body is not None:  # a direct child of w:body
+                if element.tag == WORDML_NS + "p":
+                    n_paragraphs += 1
+                del body[:]
+    return n_paragraphs
+
+
+def discover_folders(oracc_path):
+    """Finds every project under oracc_path, ie. every directory with a
+    catalogue.json (eg. saao/saa19, suhu). corpusjson directories aren't
+    searched, since they only hold texts.
+    Args:
+        oracc_path (str): path to the ORACC JSON git directory
+    Returns:
+        list (str): project folders relative to oracc_path, with / separators
+    """
+    folders = []
+    for dir_path, dir_names, file_names in os.walk(oracc_path):
+        dir_names[:] = sorted(name for name in dir_names if name != "corpusjson" and not name.startswith("."))
+        if "catalogue.json" in file_names and dir_path != oracc_path:
+            folders.append(os.path.relpath(dir_path, oracc_path).replace(os.sep, "/"))
+    return folders
+
 
 def _save_catalogue(my_catalogue, json_path):
-    with open(json_path, 'w+') as outfile:
+    """Writes my_catalogue to a temporary file next to json_path and then
+    moves it into place, so a reader never sees a half-written catalogue.
+    """
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w') as outfile:
         json.dump(my_catalogue, outfile, sort_keys=True, indent=4)
+    os.replace(tmp_path, json_path)
+
 
-def create_flat_files(oracc_path, docx_parent_path):
-    """Output some JSONs... we'll see how we want to format them later
+def _make_entry(folder, text_info, textid, location, n_lines, ochre_title=None):
+    """Makes the my-catalogue.json entry of one text; what goes in the alias
+    and description depends on the project.
+    Args:
+        location (dict): where the docx is, ie. {"docx_path": path}, or for a
+            text in a bundle {"docx_bundle": bundle path, "docx_member": member name}
+        ochre_title (str): title of the text in OCHRE; textid if None
     """
+    if "rinap" in folder:
+        entry = {
+            "docx_lines": n_lines,
+            "ochre_title": ochre_title or textid,
+            "alias": text_info["popular_name"],
+        }
+        if "collection" in text_info or "exemplars" in text_info:
+            entry.update({
+                "description": "Collection:\n{0}\nExemplars:\n{1}".format(
+                    text_info.get("collection", ""),
+                    text_info.get("exemplars", "")
+                ),
+            })
+
+    elif "ribo" in folder:
+        entry = {
+            "docx_lines": n_lines,
+            "ochre_title": ochre_title or textid,
+            "alias": text_info["popular_name"],
+        }
+        if "collection" in text_info or "exemplars" in text_info:
+            entry.update({
+                "description": "Collection:\n{0}\nExemplars:\n{1}".format(
+                    text_info.get("collection", ""),
+                    text_info.get("exemplars", "")
+                ),
+            })
+
+    elif "saao" in folder:
+        entry = {
+            "docx_lines": n_lines,
+            "ochre_title": ochre_title or textid,
+            "alias": text_info.get("museum_no", text_info["display_name"]),
+            "description": "Primary publication exemplars:\n{0}".format(
+                text_info["primary_publication"]
+            ),
+        }
+
+    else: # suhu
+        if "museum_no" not in text_info:
+            print("no museum_no in {0}".format(textid))
+        entry = {
+            "docx_lines": n_lines,
+            "ochre_title": ochre_title or textid,
+            "alias": text_info.get("museum_no", text_info["popular_name"]),
+        }
+        if "collection" in text_info:
+            entry.update({
+                "description": "Collection:\n{0}".format(
+                    text_info.get("collection", "")
+                ),
+            })
+    entry.update(location)
+    return entry
+
+
+def create_flat_files(oracc_path, docx_parent_path, catalogues, folders=None, jobs=1):
+    """Writes a my-catalogue.json into each project's docx folder, with an
+    entry for every text of the project that has a docx.
+    The docx paragraph counts (the expensive part) are spread over a pool of
+    jobs processes, across every folder at once.
+    Args:
+        oracc_path (str): path to the ORACC JSON git directory
+        docx_parent_path (str): docx directory, laid out like oracc_path
+        catalogues (CatalogueRegistry): where to read catalogue entries from
+        folders (list (str)): projects to index; defaults to every project
+            under oracc_path that has a docx folder
+        jobs (int): number of processes to count paragraphs with
+    """
+    if folders is None:
+        folders = [folder for folder in discover_folders(oracc_path)
+                   if os.path.isdir(os.path.join(docx_parent_path, folder))]
+
+    # Find every text with a docx equivalent, one directory listing per folder;
+    # texts without one aren't added to my catalogue
+    folder_texts = []
+    docx_paths = []
     for folder in folders:
+        members = catalogues.get_members(os.path.join(oracc_path, folder))
+        docx_names = set(os.listdir(os.path.join(docx_parent_path, folder)))
+        textids = [textid for textid in members if textid + ".docx" in docx_names]
+        folder_texts.append((folder, members, textids))
+        docx_paths.extend(os.path.join(docx_parent_path, folder, textid + ".docx") for textid in textids)
+
+    # Count # of lines present
+    if jobs > 1 and len(docx_paths) > 1:
+        with multiprocessing.Pool(processes=jobs) as pool:
+            line_counts = pool.map(count_paragraphs, docx_paths, chunksize=16)
+    else:
+        line_counts = [count_paragraphs(docx_path) for docx_path in docx_paths]
+
+    index = 0
+    for folder, members, textids in folder_texts:
         print(folder)
         my_catalogue = {}
+        for textid in textids:
+            my_catalogue[textid] = _make_entry(folder, members[textid], textid, {"docx_path": docx_paths[index]},
+                                               line_counts[index])
+            index += 1
 
-        # Parse catalogue JSON
-        catalogue_path = os.path.join(oracc_path, folder, "catalogue.json")
-        catalogue_dict = _read_catalogue(catalogue_path)
+        # Save to file in docx folders
+        _save_catalogue(my_catalogue, os.path.join(docx_parent_path, folder, "my-catalogue.json"))
 
-        members = catalogue_dict["members"]
 
-        for textid in members:
-            # Check if it's got a docx equivalent
-            # If not, don't bother adding it to my catalogue
-            print(textid)
-            docx_name = textid + ".docx"
-            docx_path = os.path.join(docx_parent_path, folder, docx_name)
-            if not os.path.exists(docx_path):
+def create_flat_files_from_bundles(oracc_path, docx_parent_path, catalogues, bundle_paths):
+    """Same as create_flat_files(), but for the texts of bundles written by
+    script.py --bundle: line counts come from each bundle's index, so no docx
+    has to be opened. Entries point at the member inside its bundle with
+    "docx_bundle" (the bundle's path) and "docx_member" (the member's name in
+    it) instead of "docx_path", and their ochre_title is the one in the
+    bundle's index.
+    Args:
+        oracc_path (str): path to the ORACC JSON git directory
+        docx_parent_path (str): directory to write each project's my-catalogue.json under
+        catalogues (CatalogueRegistry): where to read catalogue entries from
+        bundle_paths (list (str)): paths to the bundles
+    """
+    folder_texts = {}
+    for bundle_path in bundle_paths:
+        bundle_path = os.path.abspath(bundle_path)
+        for textid, text in sorted(DocxBundle.read_index(bundle_path).items()):
+            if text["project"] is None:
+                print("no project for {0} in {1}".format(textid, bundle_path))
                 continue
+            folder_texts.setdefault(text["project"], []).append((textid, bundle_path, text))
 
-            # Count # of lines present
-            document = Document(docx_path)
-            n_lines = len(document.paragraphs)
-
-            text_info = members[textid]
-
-            if "rinap" in folder:
-                my_catalogue.update({
-                    textid: {
-                        "docx_path": docx_path,
-                        "docx_lines": n_lines,
-                        "ochre_title": textid,
-                        "alias": text_info["popular_name"],
-                    },
-                })
-                if "collection" in text_info or "exemplars" in text_info:
-                    my_catalogue[textid].update({
-                        "description": "Collection:\n{0}\nExemplars:\n{1}".format(
-                            text_info.get("collection", ""),
-                            text_info.get("exemplars", "")
-                        ),
-                    })
-
-            elif "ribo" in folder:
-                my_catalogue.update({
-                    textid: {
-                        "docx_path": docx_path,
-                        "docx_lines": n_lines,
-                        "ochre_title": textid,
-                        "alias": text_info["popular_name"],
-                    },
-                })
-                if "collection" in text_info or "exemplars" in text_info:
-                    my_catalogue[textid].update({
-                        "description": "Collection:\n{0}\nExemplars:\n{1}".format(
-                            text_info.get("collection", ""),
-                            text_info.get("exemplars", "")
-                        ),
-                    })
-
-            elif "saao" in folder:
-                my_catalogue.update({
-                    textid: {
-                        "docx_path": docx_path,
-                        "docx_lines": n_lines,
-                        "ochre_title": textid,
-                        "alias": text_info.get("museum_no", text_info["display_name"]),
-                        "description": "Primary publication exemplars:\n{0}".format(
-                            text_info["primary_publication"]
-                        ),
-                    },
-                })
-
-            else: # suhu
-                if "museum_no" not in text_info:
-                    print("no museum_no in ^")
-                my_catalogue.update({
-                    textid: {
-                        "docx_path": docx_path,
-                        "docx_lines": n_lines,
-                        "ochre_title": textid,
-                        "alias": text_info.get("museum_no", text_info["popular_name"]),
-                    },
-                })
-                if "collection" in text_info:
-                    my_catalogue[textid].update({
-                        "description": "Collection:\n{0}".format(
-                            text_info.get("collection", "")
-                        ),
-                    })
+    for folder, texts in sorted(folder_texts.items()):
+        print(folder)
+        members = catalogues.get_members(os.path.join(oracc_path, folder))
+        my_catalogue = {}
+        for textid, bundle_path, text in texts:
+            if textid not in members:
+                continue
+            location = {"docx_bundle": bundle_path, "docx_member": text["member"]}
+            my_catalogue[textid] = _make_entry(folder, members[textid], textid, location, text["docx_lines"],
+                                               text.get("ochre_title"))
 
-        # Save to file in docx folders
-        _save_catalogue(my_catalogue, os.path.join(docx_parent_path, folder, "my-catalogue.json"))
+        folder_path = os.path.join(docx_parent_path, folder)
+        os.makedirs(folder_path, exist_ok=True)
+        _save_catalogue(my_catalogue, os.path.join(folder_path, "my-catalogue.json"))
 
 
 def main():
@@ -161,12 +248,48 @@ def main():
         required=True,
         type=str,
     )
+    parser.add_argument(
+        '--cache-directory',
+        action="store",
+        help="Directory where indexed catalogues are kept between runs (shared with script.py). Defaults to {0}".format(default_cache_directory()),
+        default=default_cache_directory(),
+        type=str,
+    )
+    parser.add_argument(
+        '--folder',
+        action="append",
+        help="Project folder to index, relative to --oracc-path (eg. saao/saa19); may be given more than once. "
+             "Defaults to every folder with a catalogue.json that also has a docx folder.",
+        dest="folders",
+        type=str,
+    )
+    parser.add_argument(
+        '--bundle',
+        action="append",
+        help="Bundle written by script.py --bundle to index from its index.json instead of docx files in "
+             "--docx-path, which is then only where my-catalogue.json files go; may be given more than once.",
+        dest="bundles",
+        type=str,
+    )
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        action="store",
+        help="Number of processes to count docx paragraphs with. Defaults to 0, which uses every available CPU.",
+        default=0,
+        type=int,
+    )
 
     args = parser.parse_args()
     oracc_path = os.path.abspath(args.oracc_path)
     docx_path = os.path.abspath(args.docx_path)
+    jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
 
-    create_flat_files(oracc_path, docx_path)
+    catalogues = CatalogueRegistry(args.cache_directory)
+    if args.bundles:
+        create_flat_files_from_bundles(oracc_path, docx_path, catalogues, args.bundles)
+    else:
+        create_flat_files(oracc_path, docx_path, catalogues, args.folders, jobs)
 
 
 if __name__ == "__main__":
@@ -5,12 +5,41 @@ import os
 import sys
 import json
 import glob
+import logging
+import array
 import argparse
+import hashlib
+import http.server
+import re
+import sqlite3
+import time
+import concurrent.futures
+import contextlib
+import copy
+import datetime
+import email.utils
+import io
+import multiprocessing
+import queue
+import struct
+import traceback
+import urllib.parse
+import zipfile
+import zlib
+from xml.sax.saxutils import escape as xml_escape
 
 import requests
 from docx import Document
 import bs4
 from bs4 import BeautifulSoup
+try:
+    import orjson # optional, decodes JSON several times faster
+except ImportError:
+    orjson = None
+try:
+    import watchdog.observers # optional, lets --watch use inotify & co. instead of polling
+except ImportError:
+    watchdog = None
 
 """
 Parses one or more JSON files and outputs well-formatted DOC(X) file(s).
@@ -49,26 +78,1003 @@ vowel_subscript_to_accent_map = {
     },
 }
 
-VERBOSE_FLAG = False
+ORACC_URL = "http://oracc.museum.upenn.edu"
+REQUEST_TIMEOUT = 30  # seconds to wait on ORACC before giving up on a page
+REQUEST_RETRIES = 3  # extra attempts for pages that fail with a connection error, 5xx or REQUEST_RETRY_STATUSES
+REQUEST_BACKOFF = 1.0  # seconds before the first retry; doubled for every retry after that
+REQUEST_RETRY_STATUSES = (408, 429)  # client errors worth retrying: request timeout and rate limiting
+REQUEST_MAX_RETRY_AFTER = 120  # most seconds to wait when ORACC asks for more with Retry-After
+SERVE_PORT = 8765  # default localhost port for --serve
+WATCH_DEBOUNCE = 1.0  # seconds without changes before --watch converts a burst of them (eg. a git pull)
+WATCH_POLL_INTERVAL = 1.0  # seconds between directory scans when --watch can't use watchdog
 
 
-def print_if_verbose(msg):
-    global VERBOSE_FLAG
-    if VERBOSE_FLAG:
-        print(msg)
+# Verbose messages are logged at DEBUG level, with their arguments only
+# formatted if they're actually printed
+logger = logging.getLogger(__name__)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """
+    Log handler writing to whatever sys.stdout is when a message is logged,
+    so that contextlib.redirect_stdout() (eg. in _convert_json_path()) captures
+    log messages along with everything printed.
+    """
+    def __init__(self):
+        logging.StreamHandler.__init__(self, sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, stream):
+        pass
+
+
+def configure_logging(verbose):
+    """Sends this module's log messages to stdout as is, including DEBUG
+    ones when verbose.
+    """
+    handler = _StdoutHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.propagate = False
+
+
+# JSON decoders to choose from; each takes a str or UTF-8 bytes
+JSON_BACKENDS = {"json": json.loads}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = orjson.loads
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def set_json_backend(name):
+    """Selects which of JSON_BACKENDS json_loads() and read_json_file() use.
+    Raises:
+        KeyError: if the backend isn't installed
+    """
+    global JSON_BACKEND
+    JSON_BACKENDS[name]
+    JSON_BACKEND = name
+
+
+def json_loads(data):
+    """Decodes a JSON document with the selected backend (the fastest one
+    installed by default). Any UTF-8 BOM is dropped first, like utf_8_sig would.
+    Args:
+        data (str or bytes): JSON document
+    Returns:
+        decoded document, eg. dict
+    """
+    if isinstance(data, bytes):
+        if data.startswith(b"\xef\xbb\xbf"):
+            data = data[3:]
+    elif data.startswith("\ufeff"):
+        data = data[1:]
+    return JSON_BACKENDS[JSON_BACKEND](data)
+
+
+def read_json_file(path):
+    """Reads and decodes a JSON file with json_loads().
+    """
+    with open(path, "rb") as fd:
+        return json_loads(fd.read())
+
+
+def hash_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def default_cache_directory():
+    """Directory used to keep indexed catalogues and other data that's
+    expensive to rebuild between runs, eg. ~/.cache/oracc-json-to-docx
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "oracc-json-to-docx")
+
+
+class CatalogueRegistry(object):
+    """
+    Class to look up catalogue.json entries by project path and textid.
+    The first time a project's catalogue is needed, its "members" get indexed
+    into an sqlite file in cache_directory, one row per textid. Later runs only
+    read the rows they need instead of decoding the whole catalogue again.
+    An index is rebuilt whenever its catalogue's mtime/size change and its
+    hash no longer matches what was indexed.
+
+    A project path is the directory holding catalogue.json, eg.
+    /path/to/json/saao/saa19 for texts in /path/to/json/saao/saa19/corpusjson.
+    """
+    def __init__(self, cache_directory=None):
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+            db_path = os.path.join(cache_directory, "catalogues.sqlite")
+        else:  # don't persist anything, eg. read-only setups
+            db_path = ":memory:"
+        self.db = sqlite3.connect(db_path, timeout=60)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS catalogues (
+                project TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                size INTEGER,
+                sha1 TEXT
+            );
+            CREATE TABLE IF NOT EXISTS members (
+                project TEXT,
+                textid TEXT,
+                entry TEXT,
+                PRIMARY KEY (project, textid)
+            );
+        """)
+        self._checked_projects = set()  # projects already validated by this process
+
+    def refresh(self):
+        """Forgets which catalogues were already checked, so the next lookup
+        in each project checks its catalogue.json for changes again. For
+        long-running processes, where once per process isn't often enough.
+        """
+        self._checked_projects.clear()
+
+    @staticmethod
+    def project_path_for(json_path):
+        """Gets the project path of a corpusjson file, ie. json_path/../..
+        """
+        return os.path.abspath(os.path.join(os.path.dirname(json_path), ".."))
+
+    def get_member(self, project_path, textid):
+        """Gets the catalogue entry of one text.
+        Args:
+            project_path (str): directory containing catalogue.json
+            textid (str): eg. Q003414
+        Returns:
+            dict: the text's entry under "members" in catalogue.json
+        Raises:
+            KeyError: if textid is not in the catalogue
+        """
+        project_path = self.ensure_indexed(project_path)
+        row = self.db.execute("SELECT entry FROM members WHERE project = ? AND textid = ?",
+                              (project_path, textid)).fetchone()
+        if row is None:
+            raise KeyError(textid)
+        return json_loads(row[0])
+
+    def get_members(self, project_path):
+        """Gets every catalogue entry of a project, in catalogue order.
+        Args:
+            project_path (str): directory containing catalogue.json
+        Returns:
+            dict: equivalent to "members" in catalogue.json
+        """
+        project_path = self.ensure_indexed(project_path)
+        rows = self.db.execute("SELECT textid, entry FROM members WHERE project = ? ORDER BY rowid",
+                               (project_path,))
+        return {textid: json_loads(entry) for textid, entry in rows}
+
+    def ensure_indexed(self, project_path):
+        """Makes sure the index of project_path's catalogue is current,
+        (re)building it if needed. Only done once per project per process.
+        Returns:
+            str: normalized project path used as the index key
+        """
+        project_path = os.path.abspath(project_path)
+        if project_path in self._checked_projects:
+            return project_path
+
+        catalogue_path = os.path.join(project_path, "catalogue.json")
+        try:
+            stat = os.stat(catalogue_path)
+        except OSError as e:
+            print("Unable to find catalogue.json at {0}.".format(catalogue_path))
+            raise e
+
+        row = self.db.execute("SELECT mtime_ns, size, sha1 FROM catalogues WHERE project = ?",
+                              (project_path,)).fetchone()
+        if not row or row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            sha1 = hash_file(catalogue_path)
+            with self.db:
+                if row and row[2] == sha1:  # touched, but not changed
+                    self.db.execute("UPDATE catalogues SET mtime_ns = ?, size = ? WHERE project = ?",
+                                    (stat.st_mtime_ns, stat.st_size, project_path))
+                else:
+                    logger.debug("Indexing catalogue %s", catalogue_path)
+                    self._index_catalogue(project_path, catalogue_path, stat, sha1)
+
+        self._checked_projects.add(project_path)
+        return project_path
+
+    def _index_catalogue(self, project_path, catalogue_path, stat, sha1):
+        """Replaces the stored index of one project with the current contents
+        of its catalogue.json. Expected to run inside a transaction.
+        """
+        members = read_json_file(catalogue_path)["members"]
+        self.db.execute("DELETE FROM members WHERE project = ?", (project_path,))
+        self.db.executemany(
+            "INSERT INTO members (project, textid, entry) VALUES (?, ?, ?)",
+            ((project_path, textid, json.dumps(entry, ensure_ascii=False)) for textid, entry in members.items())
+        )
+        self.db.execute("INSERT OR REPLACE INTO catalogues (project, mtime_ns, size, sha1) VALUES (?, ?, ?, ?)",
+                        (project_path, stat.st_mtime_ns, stat.st_size, sha1))
+
+
+class PageCache(object):
+    """
+    Class to keep copies of scraped ORACC text pages on disk, keyed by
+    project/textid, so reruns don't have to fetch the same pages again.
+    Entries older than ttl seconds are refetched. Once the cache grows past
+    max_bytes, the least recently used pages are evicted.
+    In offline mode nothing is fetched: pages come only from the cache (even
+    expired ones), and misses are reported and recorded in self.misses.
+    Only successful (2xx) responses are stored, so error pages such as a 404
+    or 429 never stand in for a text's page.
+    All fetches go through one pooled requests.Session, and prefetch() can
+    fill the cache for many texts concurrently before any of them is rendered.
+    Throttled requests (429, 408) are retried like server errors, waiting at
+    least as long as the response's Retry-After asks.
+    """
+    def __init__(self, cache_directory=None, ttl=30 * 24 * 60 * 60, max_bytes=256 * 1024 * 1024, offline=False,
+                 base_url=ORACC_URL, concurrency=8):
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+            db_path = os.path.join(cache_directory, "pages.sqlite")
+        else:
+            db_path = ":memory:"
+        self.db = sqlite3.connect(db_path, timeout=60)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                content BLOB,
+                size INTEGER,
+                fetched_at REAL,
+                accessed_at REAL
+            )
+        """)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.misses = []
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def page_url(self, project, textid):
+        return "{0}/{1}/{2}".format(self.base_url, project, textid)
+
+    def has_fresh_page(self, project, textid):
+        """Checks whether get_page() would be served from the cache.
+        """
+        key = "{0}/{1}".format(project, textid)
+        row = self.db.execute("SELECT fetched_at FROM pages WHERE key = ?", (key,)).fetchone()
+        return bool(row) and (self.offline or time.time() - row[0] < self.ttl)
+
+    def get_page(self, project, textid):
+        """Gets the HTML of a text's page on ORACC, from the cache if possible.
+        Args:
+            project (str): eg. saao/saa19
+            textid (str): eg. P334914
+        Returns:
+            bytes: page contents, or None if offline and the page isn't cached,
+                or if ORACC couldn't give it
+        """
+        key = "{0}/{1}".format(project, textid)
+        row = self.db.execute("SELECT content, fetched_at FROM pages WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row and (self.offline or now - row[1] < self.ttl):
+            with self.db:
+                self.db.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (now, key))
+            logger.debug("Using cached page for %s", key)
+            return bytes(row[0])
+
+        if self.offline:
+            print("OFFLINE: no cached page for {0}, skipping its scrape".format(key))
+            self.misses.append(key)
+            return None
+
+        try:
+            content = self._fetch(self.page_url(project, textid))
+        except requests.RequestException as e:
+            print("Couldn't fetch {0}, skipping its scrape: {1}".format(self.page_url(project, textid), e))
+            return None
+        self.put_page(project, textid, content)
+        return content
+
+    def prefetch(self, texts):
+        """Fetches the pages of several texts concurrently (at most
+        self.concurrency at a time) and stores them, so that rendering
+        doesn't have to wait on the network one text after another.
+        Pages that are already cached are skipped. Failures are reported,
+        leaving those texts to be fetched again when they're rendered.
+        Args:
+            texts (list (tuple (str, str))): (project, textid) of each text to fetch
+        Returns:
+            int: number of pages fetched
+        """
+        if self.offline:
+            return 0
+        texts = [(project, textid) for project, textid in texts if not self.has_fresh_page(project, textid)]
+        if not texts:
+            return 0
+
+        print("Prefetching {0} ORACC page(s) with {1} connection(s)".format(len(texts), self.concurrency))
+        fetched = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                executor.submit(self._fetch, self.page_url(project, textid)): (project, textid)
+                for project, textid in texts
+            }
+            # sqlite connections stay in this thread; workers only do the network part
+            for future in concurrent.futures.as_completed(futures):
+                project, textid = futures[future]
+                try:
+                    self.put_page(project, textid, future.result())
+                    fetched += 1
+                    logger.debug("Prefetched %s/%s", project, textid)
+                except Exception as e:
+                    print("Couldn't prefetch {0}: {1}".format(self.page_url(project, textid), e))
+        return fetched
+
+    def _fetch(self, url):
+        """GETs url, retrying with exponential backoff on connection errors,
+        server errors and REQUEST_RETRY_STATUSES. A Retry-After on the
+        response makes the wait at least that long (up to REQUEST_MAX_RETRY_AFTER).
+        Returns:
+            bytes: response body
+        Raises:
+            requests.RequestException: if there's no 2xx response, right away
+                for other client errors or once the retries are used up
+        """
+        for attempt in range(REQUEST_RETRIES + 1):
+            retry_after = None
+            try:
+                response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if 200 <= response.status_code < 300:
+                    return response.content
+                error = requests.HTTPError("{0} response for {1}".format(response.status_code, url), response=response)
+                if response.status_code < 500 and response.status_code not in REQUEST_RETRY_STATUSES:
+                    raise error
+                retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+            if attempt < REQUEST_RETRIES:
+                delay = REQUEST_BACKOFF * 2 ** attempt
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, REQUEST_MAX_RETRY_AFTER))
+                logger.debug("Retrying %s in %ss after: %s", url, delay, error)
+                time.sleep(delay)
+        raise error
+
+    def put_page(self, project, textid, content):
+        """Stores a fetched page, evicting the least recently used pages if
+        the cache is now over its size limit.
+        """
+        key = "{0}/{1}".format(project, textid)
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO pages (key, content, size, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                            (key, content, len(content), now, now))
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.db.execute("SELECT key, size FROM pages ORDER BY accessed_at").fetchall()
+                for old_key, size in rows:
+                    if total <= self.max_bytes or old_key == key:
+                        break
+                    self.db.execute("DELETE FROM pages WHERE key = ?", (old_key,))
+                    total -= size
+                    logger.debug("Evicted cached page %s", old_key)
+
+
+def _retry_after_seconds(value):
+    """Reads a Retry-After header, which is either a number of seconds or
+    an HTTP date.
+    Returns:
+        float: seconds to wait, or None if value is missing or unreadable
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:  # "-0000" dates are UTC too
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _docx_name_candidates(name, prefix="", extension=".docx"):
+    """Yields the file names a docx called name can be saved as, in order of
+    preference: "Q003414.docx", "Q003414 (1).docx", "Q003414 (2).docx", ...
+    each with prefix (eg. "(arc) ") in front, and extension (the writer's
+    EXTENSION) at the end.
+    Yields:
+        tuple (str, str): name with its number, and the file name
+    """
+    number_id = 0
+    while True:
+        docx_name = name if number_id == 0 else "{0} ({1})".format(name, number_id)
+        yield docx_name, prefix + docx_name + extension
+        number_id += 1
+
+
+class NameAllocator(object):
+    """
+    Class to hand out unique docx file names in an output directory, eg.
+    "Esarhaddon 088.docx", then "Esarhaddon 088 (1).docx" for the next text
+    with the same name.
+    The directory is listed once, on the first allocation, instead of
+    checking every candidate name on disk. A name is then reserved by creating
+    its file with O_CREAT | O_EXCL, which fails if anyone else (eg. another
+    worker process) got there first, so two texts never get the same name.
+    """
+    def __init__(self, output_directory):
+        self.output_directory = output_directory
+        self.taken = None  # file names known to exist, once the directory's been listed
+
+    def allocate(self, name, prefix="", extension=".docx"):
+        """Reserves the first free file name for name, creating it empty.
+        Args:
+            name (str): name to save as, without extension, eg. "Q003414"
+            prefix (str): prepended to the file name without being part of
+                what has to be unique, eg. "(arc) "
+            extension (str): eg. ".docx", or ".txt" for a TextWriter
+        Returns:
+            str: file name in output_directory, eg. "(arc) Q003414 (1).docx"
+        """
+        if self.taken is None:
+            os.makedirs(self.output_directory, exist_ok=True)
+            self.taken = set(os.listdir(self.output_directory))
+        for docx_name, file_name in _docx_name_candidates(name, prefix, extension):
+            if file_name not in self.taken:
+                try:
+                    fd = os.open(os.path.join(self.output_directory, file_name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:  # made since the directory was listed
+                    self.taken.add(file_name)
+                else:
+                    os.close(fd)
+                    self.taken.add(file_name)
+                    return file_name
+            print("{0} exists, continuing".format(docx_name))
+
+    def release(self, file_name):
+        """Gives up a name from allocate(), deleting whatever was saved under
+        it, eg. when saving the docx failed halfway.
+        """
+        try:
+            os.remove(os.path.join(self.output_directory, file_name))
+        except OSError:
+            pass
+        if self.taken is not None:
+            self.taken.discard(file_name)
+
+
+class DocxBundle(object):
+    """
+    Class to write every converted docx into one zip instead of one file
+    each, for filesystems where creating thousands of small files costs more
+    than converting them. Members are named like separate files would be (see
+    NameAllocator), and an index of every text is added as INDEX_NAME when
+    the bundle is closed:
+        {"texts": {textid: {"member": ..., "docx_lines": ..., "ochre_title": ..., "project": ...}}}
+    which index-gen.py can read instead of opening each docx.
+    The zip is written to a temporary file and only moved to path on close().
+    """
+    INDEX_NAME = "index.json"
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.zip = zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_STORED)  # docx parts are deflated already
+        self.taken = {self.INDEX_NAME}
+        self.texts = {}
+
+    def add(self, textid, name, prefix, data, n_lines, project=None, extension=".docx", ochre_title=None):
+        """Adds a docx to the bundle under the first free member name for
+        name (see NameAllocator.allocate()).
+        Args:
+            textid (str): ID of the text, eg. Q003414
+            name (str): name to save as, without extension
+            prefix (str): eg. "(arc) "
+            data (bytes): the docx
+            n_lines (int): number of paragraphs in the docx
+            project (str): ORACC project of the text, eg. rinap/rinap4
+            extension (str): extension of the member name, eg. ".docx"
+            ochre_title (str): title of the text in OCHRE (see JsonLoader); textid if None
+        Returns:
+            str: member name
+        """
+        for docx_name, member in _docx_name_candidates(name, prefix, extension):
+            if member not in self.taken:
+                break
+            print("{0} exists, continuing".format(docx_name))
+        self.zip.writestr(member, data)
+        self.taken.add(member)
+        self.texts[textid] = {"member": member, "docx_lines": n_lines, "ochre_title": ochre_title or textid,
+                              "project": project}
+        return member
+
+    def close(self):
+        """Writes the index and moves the finished bundle into place.
+        """
+        self.zip.writestr(self.INDEX_NAME, json.dumps({"texts": self.texts}, sort_keys=True, indent=4))
+        self.zip.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def discard(self):
+        """Gives up on the bundle, eg. when the run was interrupted, leaving
+        any bundle already at path as it was.
+        """
+        self.zip.close()
+        try:
+            os.remove(self.path + ".tmp")
+        except OSError:
+            pass
+
+    @classmethod
+    def read_index(cls, path):
+        """Reads the index of a bundle written by DocxBundle.
+        Returns:
+            dict: textid -> dict with "member", "docx_lines", "ochre_title" and "project"
+        """
+        with zipfile.ZipFile(path) as bundle:
+            return json_loads(bundle.read(cls.INDEX_NAME))["texts"]
+
+
+class DocumentCollector(object):
+    """
+    Stand-in for a DocxBundle in worker processes, which can't share the
+    zip: keeps the keyword arguments of each add() so the parent can add them
+    to the real bundle with DocxBundle.add(**document).
+    """
+    def __init__(self):
+        self.documents = []  # dicts of DocxBundle.add() arguments
+
+    def add(self, **document):
+        self.documents.append(document)
+        return None
+
+
+_l_node_re = re.compile(br'"node"\s*:\s*"l"')
+# A gdl key, or the language of a lemma that never has one (see JsonParser.parse_l_node)
+_complete_lemma_re = re.compile(br'"gdl"\s*:|"lang"\s*:\s*"(?:arc|qcu-949)"')
+_SCAN_OVERLAP = 256  # bytes kept from one chunk to the next, so keys split between them are still found
+
+
+class BuildManifest(object):
+    """
+    Class to remember what every text in an output directory was last
+    converted from, so that unchanged texts can be skipped on the next run.
+    Kept as FILENAME in the output directory, with one entry per textid (ie.
+    the JSON's file name, as in ORACC) holding hashes of the source JSON and
+    its catalogue entry, the converter version and the name of the docx saved.
+    A text is current when all of those still match and its docx still exists.
+    Like CatalogueRegistry, a source is only rehashed when its mtime/size change.
+    Each output format (see --format) keeps a manifest of its own, eg.
+    ".txt-manifest.json", so several can be kept in one output directory.
+    """
+    FILENAME = ".docx-manifest.json"
+
+    def __init__(self, output_directory, catalogues, converter_version, extension=".docx"):
+        self.output_directory = output_directory
+        self.path = os.path.join(output_directory, self.FILENAME.replace(".docx", extension, 1))
+        self.catalogues = catalogues
+        self.converter_version = converter_version
+        self.pending = {}  # textid -> fingerprint of texts checked but not recorded yet
+        try:
+            self.entries = read_json_file(self.path)["texts"]
+        except (OSError, ValueError, KeyError):
+            self.entries = {}
+
+    @staticmethod
+    def textid_for(json_path):
+        return os.path.splitext(os.path.basename(json_path))[0]
+
+    def is_current(self, json_path):
+        """Checks whether json_path's docx is still up to date.
+        Args:
+            json_path (str): path to an ORACC JSON file
+        Returns:
+            bool: True if neither the JSON, its catalogue entry nor the
+                converter changed since its docx was saved
+        """
+        textid = self.textid_for(json_path)
+        entry = self.entries.get(textid)
+        fingerprint = self._fingerprint(json_path, entry)
+        self.pending[textid] = fingerprint
+        if not entry:
+            return False
+        if any(entry.get(key) != fingerprint[key] for key in ("source", "catalogue", "converter")):
+            return False
+        return not entry["output"] or os.path.exists(os.path.join(self.output_directory, entry["output"]))
+
+    def remove_output(self, json_path):
+        """Deletes the docx json_path was last saved as, before it gets
+        converted again, so the new one takes its name instead of eg. "Q003414 (1)".
+        """
+        entry = self.entries.get(self.textid_for(json_path))
+        if not entry or not entry["output"]:
+            return
+        try:
+            os.remove(os.path.join(self.output_directory, entry["output"]))
+            logger.debug("Removed stale %s", entry["output"])
+        except OSError:
+            pass
+
+    def forget(self, json_path):
+        """Deletes the output of a JSON that's been removed, and its entry.
+        """
+        self.remove_output(json_path)
+        textid = self.textid_for(json_path)
+        self.entries.pop(textid, None)
+        self.pending.pop(textid, None)
+
+    def record(self, json_path, output_name):
+        """Records that json_path was converted, as of when is_current() last
+        checked it.
+        Args:
+            json_path (str): path to an ORACC JSON file
+            output_name (str): file name of the docx saved, or "" if the text
+                had nothing to save
+        """
+        textid = self.textid_for(json_path)
+        entry = self.pending.pop(textid, None)
+        if entry is None:
+            try:
+                entry = self._fingerprint(json_path, self.entries.get(textid))
+            except OSError:  # removed since it was converted; left for the next run to notice
+                return
+        entry["output"] = output_name
+        self.entries[textid] = entry
+
+    def save(self):
+        """Writes the manifest out, replacing the old one in one step so an
+        interrupted run never leaves it half-written.
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf_8") as fd:
+            json.dump({"texts": self.entries}, fd, indent=1, sort_keys=True, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _fingerprint(self, json_path, entry):
+        stat = os.stat(json_path)
+        if entry and entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+            source = entry["source"]
+        else:
+            source = hash_file(json_path)
+
+        try:
+            member = self.catalogues.get_member(CatalogueRegistry.project_path_for(json_path),
+                                                self.textid_for(json_path))
+            catalogue = hashlib.sha1(json.dumps(member, sort_keys=True).encode("utf_8")).hexdigest()
+        except Exception:  # no catalogue (entry); loading the text will report it
+            catalogue = None
+
+        return {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "source": source,
+            "catalogue": catalogue,
+            "converter": self.converter_version,
+        }
+
+
+def _count_l_nodes(json_path, chunk_size=1 << 20):
+    """Counts the L-nodes of a JSON file, and how many gdl keys and Aramaic
+    (or other gdl-less) lemmas it has, reading it a chunk at a time.
+    Returns:
+        tuple (int, int): L-nodes, and gdl keys plus gdl-less lemmas
+    """
+    n_l_nodes = 0
+    n_complete = 0
+    tail = b""
+    with open(json_path, "rb") as fd:
+        while True:
+            chunk = fd.read(chunk_size)
+            if not chunk:
+                break
+            buf = tail + chunk
+            # matches ending in tail were already counted with the chunk before
+            n_l_nodes += sum(1 for match in _l_node_re.finditer(buf) if match.end() > len(tail))
+            n_complete += sum(1 for match in _complete_lemma_re.finditer(buf) if match.end() > len(tail))
+            tail = buf[-_SCAN_OVERLAP:]
+    return n_l_nodes, n_complete
+
+
+def find_texts_to_scrape(json_paths, stream_json=False):
+    """Finds texts with L-nodes lacking gdl, ie. the ones JsonParser will need
+    to scrape from ORACC (seen in SAAO, Suhu, ribo/babylon6). Files with at
+    least as many gdl keys and Aramaic lemmas as L-nodes can't have any, so
+    only the others get decoded to check; with stream_json through a
+    CdlReader, so no file is ever held in memory whole.
+    Texts this misses still get scraped when they're parsed, just not ahead of time.
+    Args:
+        json_paths (list (str)): paths to ORACC JSON files
+        stream_json (bool): decode files incrementally
+    Returns:
+        list (tuple (str, str)): (project, textid) of each text needing a scrape
+    """
+    texts = []
+    for json_path in json_paths:
+        reader = None
+        try:
+            n_l_nodes, n_complete = _count_l_nodes(json_path)
+            if n_complete >= n_l_nodes:
+                continue
+            if stream_json:
+                reader = CdlReader(open(json_path, encoding="utf_8_sig"))
+                json_dict = reader.read_header()
+            else:
+                json_dict = read_json_file(json_path)
+            nodes = json_dict.get("cdl", [])
+            for kind, node in nodes.events() if isinstance(nodes, CdlReader) else walk_cdl(nodes):
+                if kind == "l":
+                    f = node.get("f", {})
+                    if f.get("lang") not in ("arc", "qcu-949") and not f.get("gdl"):
+                        texts.append((json_dict["project"], json_dict["textid"]))
+                        break
+        except Exception as e:
+            logger.debug("Couldn't check %s for incomplete L-nodes: %s", json_path, e)
+        finally:
+            if reader is not None:
+                reader.close()
+    return texts
+
+
+class CdlReader(object):
+    """
+    Class to read an ORACC corpusjson file incrementally, so that huge texts
+    never have to be held in memory whole, neither as a string nor as a dict.
+    read_header() decodes the top-level members that come before "cdl" (type,
+    project, textid...). events() then streams the cdl tree as the same
+    (kind, node) events walk_cdl() makes from an in-memory one: C-nodes are
+    read member by member and come out as a "c" event with the members seen
+    before their own "cdl", followed by their nodes and a "/c" event; D- and
+    L-nodes are small, so each is decoded in one go.
+    Only chunk_size characters are read at a time and consumed input is dropped.
+    Values are always decoded with the stdlib json, whatever JSON_BACKEND is,
+    since it's the one with raw_decode().
+    """
+    HEADER_FIELDS = ("type", "project", "textid")
+    _node_kind_re = re.compile(r'\{\s*"node"\s*:\s*"([^"\\]*)"')
+
+    def __init__(self, fd, chunk_size=1 << 16):
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.header = None
+        self._top_members = None
+
+    def read_header(self):
+        """Reads the top-level members that come before "cdl".
+        If any of HEADER_FIELDS only comes after it, the cdl gets decoded
+        whole (like json.load would) and so does the rest of the file.
+        Returns:
+            dict: top-level members read so far; its "cdl" is this reader
+                when the cdl is left to be streamed by events()
+        """
+        self.header = {}
+        self._top_members = self._members()
+        for key in self._top_members:
+            if key == "cdl" and all(field in self.header for field in self.HEADER_FIELDS):
+                self.header["cdl"] = self
+                return self.header
+            self.header[key] = self._decode()
+        self.close()
+        return self.header
+
+    def events(self):
+        """Streams the cdl tree; see walk_cdl(). Any top-level members after
+        "cdl" are added to the header once the tree is done.
+        Yields:
+            tuple (str, dict): kind of event ("c", "/c", "d", "l"...) and its node
+        Raises:
+            ValueError: if the JSON is malformed
+        """
+        try:
+            self._expect("[")
+            stack = [None]  # members and fields of the C-nodes we're inside of, None for the top level
+            while True:
+                char = self._peek()
+                if char == "]":  # end of a cdl list
+                    self.pos += 1
+                    entry = stack.pop()
+                    if entry is None:
+                        break
+                    members, fields = entry
+                    for key in members:  # anything after the C-node's own "cdl"
+                        fields[key] = self._decode()
+                    yield "/c", fields
+                    self._skip_comma()
+                    continue
+
+                kind = self._peek_node_kind()
+                if kind is not None and kind != "c":
+                    node = self._decode()
+                    yield kind, node
+                    self._skip_comma()
+                    continue
+
+                members = self._members()
+                fields = {}
+                for key in members:
+                    if key == "cdl" and fields.get("node") == "c" and self._peek() == "[":
+                        self.pos += 1
+                        yield "c", fields
+                        stack.append((members, fields))
+                        break
+                    fields[key] = self._decode()
+                else:  # not a C-node after all, or one whose cdl wasn't a list coming after "node"
+                    if fields.get("node") == "c":
+                        # same events as walk_cdl(), from the cdl decoded along with the rest (if any)
+                        yield "c", fields
+                        for event in walk_cdl(fields.get("cdl") or ()):
+                            yield event
+                        yield "/c", fields
+                    else:
+                        yield fields.get("node"), fields
+                    self._skip_comma()
+
+            for key in self._top_members:
+                self.header[key] = self._decode()
+        finally:
+            self.close()
+
+    def close(self):
+        self.fd.close()
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self, size=None):
+        """Reads more of the file into the buffer, dropping everything before pos.
+        Returns:
+            bool: False if there was nothing left to read
+        """
+        if self.eof:
+            return False
+        data = self.fd.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skips whitespace and returns the next character ("" at the end of the file).
+        """
+        while True:
+            buf = self.buf
+            pos = self.pos
+            length = len(buf)
+            while pos < length and buf[pos] in " \t\n\r":
+                pos += 1
+            self.pos = pos
+            if pos < length:
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError("Expected {0!r} but got {1!r}".format(char, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def _skip_comma(self):
+        if self._peek() == ",":
+            self.pos += 1
+
+    def _decode(self):
+        """Decodes the JSON value at pos, reading more of the file until it's complete.
+        """
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:  # eg. a number could still go on in the next chunk
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill(size)
+            size *= 2  # keeps very long values from being retried over and over
+
+    def _members(self):
+        """Yields the keys of the object at pos one by one. The caller has to
+        consume each key's value before asking for the next key.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            yield key
+            char = self._peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or '}}' but got {0!r}".format(self.buf[self.pos - 1:self.pos + 20]))
+
+    def _peek_node_kind(self):
+        """Gets the kind of node starting at pos, as long as "node" is its first member.
+        """
+        if self._peek() != "{":
+            raise ValueError("Expected a node but got {0!r}".format(self.buf[self.pos:self.pos + 20]))
+        match = self._node_kind_re.match(self.buf, self.pos)
+        if match is None and len(self.buf) - self.pos < 256 and self._fill():
+            match = self._node_kind_re.match(self.buf, self.pos)
+        return match.group(1) if match else None
+
+
+def walk_cdl(nodes):
+    """Walks a cdl list in document order without recursing, as (kind, node)
+    events: kind is the node's "node" ("c", "d" or "l"), and every C-node's
+    own nodes are followed by a ("/c", node) event. CdlReader.events() makes
+    the same events while reading a file.
+    Args:
+        nodes (list (dict)): cdl member of an ORACC JSON or of a C-node
+    Yields:
+        tuple (str, dict)
+    """
+    stack = [iter(nodes)]  # node lists of the C-nodes we're inside of
+    parents = []
+    while stack:
+        for node in stack[-1]:
+            kind = node["node"]
+            yield kind, node
+            if kind == "c":
+                # go down into this C-node; the rest of this list is resumed once it's done
+                stack.append(iter(node.get("cdl") or ()))
+                parents.append(node)
+                break
+        else:  # done with this list
+            stack.pop()
+            if parents:
+                yield "/c", parents.pop()
 
 
 class JsonLoader(object):
     """
     Class to read from a filename/pathname containing one or more JSON files
     and make accessible a list of dicts (one per JSON/exemplar).
+    With lazy=True nothing is read up front; iter_json_dicts() then loads one
+    JSON at a time so only a single text needs to be held in memory.
+    Catalogue info is looked up through a CatalogueRegistry, so each JSON is
+    matched with the catalogue.json of its own project.
+    With stream_cdl=True, each text's cdl is only read as it's parsed (see
+    CdlReader), which keeps memory flat however big a text is.
     """
-    def __init__(self, original_path):
-        print_if_verbose("Using encoding {0}".format(sys.stdout.encoding)) # cp1252; can't process some UTF-8 stuff because windoze :(
+    def __init__(self, original_path, lazy=False, catalogues=None, stream_cdl=False):
+        logger.debug("Using encoding %s", sys.stdout.encoding) # cp1252; can't process some UTF-8 stuff because windoze :(
 
-        self.catalogue_dict = None
+        self.catalogues = catalogues or CatalogueRegistry(default_cache_directory())
+        self.stream_cdl = stream_cdl
+        self.original_path = original_path
         self.json_paths = self._get_file_paths(original_path)
-        self.json_dicts = self._load_json_dicts()
+        self.json_dicts = None if lazy else self._load_json_dicts()
         self.q_number = os.path.basename(original_path).split(".json")[0]
 
     def _get_file_paths(self, original_path):
@@ -92,6 +1098,11 @@ class JsonLoader(object):
                             "Please ensure that your given path points to either "
                             "a .json or a directory containing .json files.")
 
+    def rescan(self):
+        """Lists the JSON files at original_path again, eg. after some were added.
+        """
+        self.json_paths = self._get_file_paths(self.original_path)
+
     def _load_json_dicts(self):
         """Loads one or more ORACC JSON files into one or more python dicts.
         If a JSON file is unable to be read, its corresponding dict will be empty,
@@ -99,83 +1110,700 @@ class JsonLoader(object):
         Returns:
             list (dict): loaded from the raw JSON files
         """
-        json_dicts = []
+        return list(self.iter_json_dicts())
+
+    def iter_json_dicts(self):
+        """Loads ORACC JSON files one at a time, in the same order and with the
+        same contents as get_json_dicts(). Each dict is only read once it's asked
+        for, so a caller that converts and drops each text before moving on to
+        the next only ever holds one of them in memory.
+        Yields:
+            dict: loaded from the raw JSON file
+        """
         for json_path in self.json_paths:
-            try:
-                with open(json_path, encoding="utf_8_sig") as fd:
-                    raw_str = fd.read()
-                    json_dict = json.loads(raw_str)
-                    q_number = json_dict["textid"] # aka. CDLI number
+            yield self.load_json_dict(json_path)
+
+    def load_json_dict(self, json_path):
+        """Loads a single ORACC JSON file into a python dict, enriched with
+        info from its catalogue. If the JSON file is unable to be read, the
+        dict will be empty, save for its original path.
+        With stream_cdl, only the header is read here; the dict's "cdl" is then
+        a CdlReader that JsonParser reads from as it goes.
+        Args:
+            json_path (str): path to an ORACC JSON file
+        Returns:
+            dict: loaded from the raw JSON file
+        """
+        json_dict = None
+        try:
+            json_dict = self._read_json(json_path)
+            q_number = json_dict["textid"] # aka. CDLI number
 
-                    if not self.catalogue_dict:
-                        self.catalogue_dict = self._get_catalogue_json(json_path)
+            # Add in additional data to JSONs, mostly from their catalog
+            {'collection': 'Iraq Museum, Baghdad, Iraq',
+             'designation': 'Unidentified Suhu 1007',
+             'display_name': 'Suhu Unidentified Suhu 1006',
+             'museum_no': 'IM 096751',
+             'popular_name': 'RIMB 2 S.0.0.1006',
+             'primary_publication': 'Unidentified Suhu 1006'}
 
-                    # Add in additional data to JSONs, mostly from their catalog
-                    {'collection': 'Iraq Museum, Baghdad, Iraq',
-                     'designation': 'Unidentified Suhu 1007',
-                     'display_name': 'Suhu Unidentified Suhu 1006',
-                     'museum_no': 'IM 096751',
-                     'popular_name': 'RIMB 2 S.0.0.1006',
-                     'primary_publication': 'Unidentified Suhu 1006'}
+            json_dict["original_path"] = json_path
+            q_catalogue = self.catalogues.get_member(CatalogueRegistry.project_path_for(json_path), q_number)
 
-                    json_dict["original_path"] = json_path
-                    q_catalogue = self.catalogue_dict["members"][q_number]
+            json_dict["museum_no"] = q_catalogue.get("museum_no") # seen in SAAO, SUHU
+            if json_dict["museum_no"] == "IM -": # duds, seen in SAAO
+                json_dict["museum_no"] = ''
 
-                    json_dict["museum_no"] = q_catalogue.get("museum_no") # seen in SAAO, SUHU
-                    if json_dict["museum_no"] == "IM -": # duds, seen in SAAO
-                        json_dict["museum_no"] = ''
+            json_dict["exemplars"] = q_catalogue.get("exemplars") # Seen in RINAP, RIBO
+            json_dict["collection"] = q_catalogue.get("collection") # same as above; add as supplemental info
 
-                    json_dict["exemplars"] = q_catalogue.get("exemplars") # Seen in RINAP, RIBO
-                    json_dict["collection"] = q_catalogue.get("collection") # same as above; add as supplemental info
+            json_dict["primary_publication"] = q_catalogue["primary_publication"] # eg. Esarhaddon 088, Tiglath-pileser III 01, SAA 19 215,
 
-                    json_dict["primary_publication"] = q_catalogue["primary_publication"] # eg. Esarhaddon 088, Tiglath-pileser III 01, SAA 19 215,
 
+            if json_dict["museum_no"]:
+                json_dict["ochre_title"] = json_dict["museum_no"]
+            else:
+                json_dict["ochre_title"] = "(PUB) " + json_dict["primary_publication"]
+            # TODO NOTE idea: have text file with real museum info for RINAP/RIBO lined up with the q-nums. I don't know which is the real publication info anymore
+            # even just a Q-num textfile + hotkey to prepopulate name of doc can help...
 
-                    if json_dict["museum_no"]:
-                        json_dict["ochre_title"] = json_dict["museum_no"]
-                    else:
-                        json_dict["ochre_title"] = "(PUB) " + json_dict["primary_publication"]
-                    # TODO NOTE idea: have text file with real museum info for RINAP/RIBO lined up with the q-nums. I don't know which is the real publication info anymore
-                    # even just a Q-num textfile + hotkey to prepopulate name of doc can help...
+            json_dict["docx_name"] = q_number
 
-                    json_dict["docx_name"] = q_number
+            return json_dict
+        except Exception as e:
+            if json_dict and isinstance(json_dict.get("cdl"), CdlReader):
+                json_dict["cdl"].close()
+            print("Could not load {0} to dict: {1}".format(json_path, e))
+            print("If this is an encoding error, check that the venv is based on py3, not py2")
+            return {
+                "original_path": json_path,
+            }
 
-                    json_dicts.append(json_dict)
-            except Exception as e:
-                print("Could not load {0} to dict: {1}".format(json_path, e))
-                print("If this is an encoding error, check that the venv is based on py3, not py2")
-                json_dicts.append({
-                    "original_path": json_path,
-                })
-        return json_dicts
+    def _read_json(self, json_path):
+        if self.stream_cdl:
+            reader = CdlReader(open(json_path, encoding="utf_8_sig"))
+            try:
+                return reader.read_header()
+            except Exception:
+                reader.close()
+                raise
+        return read_json_file(json_path)
 
     def get_json_dicts(self):
+        if self.json_dicts is None:
+            self.json_dicts = self._load_json_dicts()
         return self.json_dicts # TODO make this into property
 
-    def _get_catalogue_json(self, json_path):
-        """Gets output of reading from json_path/../catalogue.json.
+    def _read_json_dict(self, filename):
+        return read_json_file(filename)
+
+
+class TokenStream(object):
+    """
+    Compact, renderer-independent form of a parsed text: run texts, one byte
+    of formatting flags per run, and the index of the first run of each
+    paragraph. JsonParser's CDL walk only ever appends to one of these;
+    turning it into an actual document is left to eg. render_docx().
+    Its add_paragraph()/add_run() mirror the python-docx calls they replace.
+
+    With coalesce on (the default), a run with the same formatting as the
+    one before it in the same paragraph is merged into it, and empty runs are
+    dropped, so documents come out with far fewer <w:r> elements but the same
+    visible text and styling. runs_added counts runs as they were added.
+
+    It also keeps track, as runs come in, of what JsonParser used to rederive
+    from the text itself: whether there's any real content worth saving, and
+    whether the paragraph being added to is still blank or holds a header
+    (see current_is_blank and current_has_header).
+    """
+    __slots__ = ("texts", "flags", "paragraph_starts", "coalesce", "runs_added", "_head",
+                 "_paragraph_blank", "_paragraph_header", "_paragraph_tail", "_scanned")
+
+    # Documents whose whole text is one of these count as empty
+    EMPTY_TEXTS = ("", "Obverse", "Text")
+    # A paragraph with one of these anywhere in it counts as a header
+    HEADER_WORDS = ("Text", "Obverse", "Reverse", "column")
+    # Characters of a paragraph kept to find header words split between runs
+    _HEADER_TAIL = max(len(word) for word in HEADER_WORDS) - 1
+
+    ITALIC = 1
+    SUPERSCRIPT = 2
+
+    def __init__(self, coalesce=True):
+        self.texts = []
+        self.flags = array.array("B")
+        self.paragraph_starts = array.array("L")
+        self.coalesce = coalesce
+        self.runs_added = 0
+        self._head = ""  # all text so far, until it's too long to be one of EMPTY_TEXTS; then None
+        self._paragraph_blank = True
+        self._paragraph_header = False
+        self._paragraph_tail = ""  # end of the current paragraph's text, until a header word is found
+        self._scanned = (0, 0)  # (run, characters of it) up to which the current paragraph was looked at
+
+    def __len__(self):
+        """Number of paragraphs so far.
+        """
+        return len(self.paragraph_starts)
+
+    def add_paragraph(self, text=None):
+        """Starts a new paragraph, optionally with a first unformatted run.
+        """
+        self.paragraph_starts.append(len(self.texts))
+        self._paragraph_blank = True
+        self._paragraph_header = False
+        self._paragraph_tail = ""
+        self._scanned = (len(self.texts), 0)
+        if text:
+            self.add_run(text)
+
+    def add_header(self, header):
+        """Starts a new paragraph holding only a header such as "Obverse".
+        """
+        self.add_paragraph(header)
+
+    @property
+    def has_content(self):
+        """Whether the document has anything worth saving, ie. its text
+        (stripped) isn't empty or just a header like "Obverse".
+        """
+        return self._head is None or self._head.strip() not in self.EMPTY_TEXTS
+
+    @property
+    def current_is_blank(self):
+        """Whether the paragraph being added to has nothing but whitespace so far.
+        Raises:
+            IndexError: if there's no paragraph yet
+        """
+        self._scan_paragraph()
+        return self._paragraph_blank
+
+    @property
+    def current_has_header(self):
+        """Whether the paragraph being added to has one of HEADER_WORDS in it.
+        Raises:
+            IndexError: if there's no paragraph yet
         """
+        self._scan_paragraph()
+        return self._paragraph_header
+
+    def _scan_paragraph(self):
+        """Updates current_is_blank/current_has_header with the text added to
+        the current paragraph since they were last asked for. Done when asked
+        rather than as runs are added, which would cost every run something.
+        """
+        if not self.paragraph_starts:
+            raise IndexError("No paragraph yet")
+        run, offset = self._scanned
+        texts = self.texts
+        if run >= len(texts):  # nothing added yet
+            return
+        # only the last run can have grown (see add_run()), so the new text starts at offset
+        text = "".join(texts[run:])[offset:]
+        self._scanned = (len(texts) - 1, len(texts[-1]))
+        if self._paragraph_blank and text and not text.isspace():
+            self._paragraph_blank = False
+        if not self._paragraph_header:
+            tail = self._paragraph_tail + text
+            if any(word in tail for word in self.HEADER_WORDS):
+                self._paragraph_header = True
+            else:
+                self._paragraph_tail = tail[-self._HEADER_TAIL:]
+
+    def add_run(self, text, italic=False, superscript=False):
+        """Adds a run to the last paragraph.
+        Raises:
+            IndexError: if there's no paragraph yet
+        """
+        if not self.paragraph_starts:
+            raise IndexError("No paragraph to add run {0!r} to".format(text))
+        flags = (self.ITALIC if italic else 0) | (self.SUPERSCRIPT if superscript else 0)
+        self.runs_added += 1
+        if self._head is not None and text:
+            self._head += text
+            if len(self._head.strip()) > max(len(empty_text) for empty_text in self.EMPTY_TEXTS):
+                self._head = None
+        if self.coalesce:
+            if not text:
+                return
+            if len(self.texts) > self.paragraph_starts[-1] and self.flags[-1] == flags:
+                self.texts[-1] += text
+                return
+        self.texts.append(text or "")
+        self.flags.append(flags)
+
+    @classmethod
+    def coalesced(cls, runs):
+        """Merges (text, italic, superscript) runs the way add_run() does
+        with coalesce on, eg. for writers that mark up each formatting change.
+        Returns:
+            tuple: (text, flags) for each merged, non-empty run
+        """
+        merged = []
+        for text, italic, superscript in runs:
+            flags = (cls.ITALIC if italic else 0) | (cls.SUPERSCRIPT if superscript else 0)
+            if not text:
+                continue
+            if merged and merged[-1][1] == flags:
+                merged[-1] = (merged[-1][0] + text, flags)
+            else:
+                merged.append((text, flags))
+        return tuple(merged)
+
+    def paragraph_text(self, index=-1):
+        """Gets the text of all runs of one paragraph (the last one by default).
+        """
+        start, end = self._paragraph_bounds(index)
+        return "".join(self.texts[start:end])
+
+    def paragraphs(self):
+        """Yields each paragraph as a list of (text, italic, superscript) runs.
+        """
+        for index in range(len(self.paragraph_starts)):
+            start, end = self._paragraph_bounds(index)
+            yield [
+                (self.texts[i], bool(self.flags[i] & self.ITALIC), bool(self.flags[i] & self.SUPERSCRIPT))
+                for i in range(start, end)
+            ]
+
+    def _paragraph_bounds(self, index):
+        if index < 0:
+            index += len(self.paragraph_starts)
+        start = self.paragraph_starts[index]  # IndexError if there's no such paragraph
+        if index + 1 < len(self.paragraph_starts):
+            return start, self.paragraph_starts[index + 1]
+        return start, len(self.texts)
+
+
+def render_docx(stream, doc=None):
+    """Renders a TokenStream into a python-docx document.
+    Args:
+        stream (TokenStream): parsed text
+        doc (docx.Document): document to add paragraphs to; a new one if None
+    Returns:
+        docx.Document: the rendered document
+    """
+    if doc is None:
+        doc = Document()
+    for runs in stream.paragraphs():
+        p = doc.add_paragraph()
+        for text, italic, superscript in runs:
+            r = p.add_run(text)
+            if italic:
+                r.italic = True
+            if superscript:
+                r.font.superscript = True
+    return doc
+
+
+class PythonDocxWriter(object):
+    """
+    Writes a TokenStream to a .docx through python-docx's object model.
+
+    With keep_template, python-docx's default template is loaded once and
+    each file is rendered into a deep copy of it, which takes about half as
+    long as loading the template from disk again (see ConversionService).
+    """
+    EXTENSION = ".docx"
+    CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+    def __init__(self, keep_template=False):
+        self._template = Document() if keep_template else None
+
+    def write(self, stream, path_or_file):
+        doc = copy.deepcopy(self._template) if self._template is not None else None
+        render_docx(stream, doc).save(path_or_file)
+
+
+class OoxmlWriter(object):
+    """
+    Writes a TokenStream straight to a .docx, generating word/document.xml
+    as text instead of going through python-docx's object model one
+    add_run at a time. The output has the same paragraphs/italic/superscript
+    markup python-docx would produce.
+
+    Every other part of the package comes from python-docx's default
+    template. Those parts are deflated once when the writer is made, then
+    copied into each file as-is, so per file only document.xml gets compressed.
+    """
+    EXTENSION = ".docx"
+    CONTENT_TYPE = PythonDocxWriter.CONTENT_TYPE
+    _run_properties = {
+        0: "",
+        TokenStream.ITALIC: "<w:rPr><w:i/></w:rPr>",
+        TokenStream.SUPERSCRIPT: '<w:rPr><w:vertAlign w:val="superscript"/></w:rPr>',
+        TokenStream.ITALIC | TokenStream.SUPERSCRIPT: '<w:rPr><w:i/><w:vertAlign w:val="superscript"/></w:rPr>',
+    }
+    _special_chars_re = re.compile("([\t\n\r])")
+
+    def __init__(self, compresslevel=zlib.Z_DEFAULT_COMPRESSION):
+        self.compresslevel = compresslevel
+        now = time.localtime()
+        self._dos_time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+        self._dos_date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+
+        template = io.BytesIO()
+        Document().save(template)
+        self._parts = []  # (name, crc, compressed data, size); None marks where document.xml goes
+        with zipfile.ZipFile(template) as zf:
+            for info in zf.infolist():
+                data = zf.read(info.filename)
+                if info.filename == "word/document.xml":
+                    xml = data.decode("utf_8")
+                    body_start = xml.index("<w:body>") + len("<w:body>")
+                    self._document_head = xml[:body_start]
+                    self._document_tail = xml[body_start:]  # ie. sectPr onwards
+                    self._parts.append(None)
+                else:
+                    self._parts.append(self._deflate(info.filename, data))
+
+    def write(self, stream, path_or_file):
+        """Writes stream as a .docx to a path or a binary file object.
+        """
+        document_xml = self.document_xml(stream).encode("utf_8")
+        parts = [part or self._deflate("word/document.xml", document_xml) for part in self._parts]
+        if hasattr(path_or_file, "write"):
+            self._write_zip(parts, path_or_file)
+        else:
+            with open(path_or_file, "wb") as fd:
+                self._write_zip(parts, fd)
+
+    def document_xml(self, stream):
+        """Generates the contents of word/document.xml for stream.
+        """
+        xml = [self._document_head]
+        for runs in stream.paragraphs():
+            if not runs:
+                xml.append("<w:p/>")
+                continue
+            xml.append("<w:p>")
+            for text, italic, superscript in runs:
+                xml.append(self._run_xml(text, (TokenStream.ITALIC if italic else 0) |
+                                               (TokenStream.SUPERSCRIPT if superscript else 0)))
+            xml.append("</w:p>")
+        xml.append(self._document_tail)
+        return "".join(xml)
+
+    def _run_xml(self, text, flags):
+        properties = self._run_properties[flags]
+        if not text:
+            return "<w:r>{0}</w:r>".format(properties) if properties else "<w:r/>"
+        content = []
+        # Same as python-docx: tabs and line breaks get their own elements
+        for piece in self._special_chars_re.split(text):
+            if piece == "\t":
+                content.append("<w:tab/>")
+            elif piece == "\n" or piece == "\r":
+                content.append("<w:br/>")
+            elif piece:
+                if len(piece.strip()) < len(piece):
+                    content.append('<w:t xml:space="preserve">{0}</w:t>'.format(xml_escape(piece)))
+                else:
+                    content.append("<w:t>{0}</w:t>".format(xml_escape(piece)))
+        return "<w:r>{0}{1}</w:r>".format(properties, "".join(content))
+
+    def _deflate(self, name, data):
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        return name.encode("utf_8"), zlib.crc32(data) & 0xffffffff, compressed, len(data)
+
+    def _write_zip(self, parts, fd):
+        """Writes already deflated parts out as a zip archive.
+        """
+        offset = 0
+        central_directory = []
+        for name, crc, compressed, size in parts:
+            header = struct.pack("<IHHHHHIIIHH", 0x04034b50, 20, 0, zipfile.ZIP_DEFLATED,
+                                 self._dos_time, self._dos_date, crc, len(compressed), size, len(name), 0)
+            fd.write(header)
+            fd.write(name)
+            fd.write(compressed)
+            central_directory.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014b50, 20, 20, 0, zipfile.ZIP_DEFLATED,
+                self._dos_time, self._dos_date, crc, len(compressed), size, len(name), 0, 0, 0, 0, 0, offset
+            ) + name)
+            offset += len(header) + len(name) + len(compressed)
+
+        central_directory = b"".join(central_directory)
+        fd.write(central_directory)
+        fd.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, len(parts), len(parts),
+                             len(central_directory), offset, 0))
+
+
+WRITERS = {
+    "python-docx": PythonDocxWriter,
+    "ooxml": OoxmlWriter,
+}
+
+
+def _write_output(data, path_or_file):
+    """Writes bytes to a path or a binary file object.
+    """
+    if hasattr(path_or_file, "write"):
+        path_or_file.write(data)
+    else:
+        with open(path_or_file, "wb") as fd:
+            fd.write(data)
+
+
+class TextWriter(object):
+    """
+    Writes a TokenStream as UTF-8 plain text, for eyeballing a text or
+    diffing it between ORACC releases: one line per docx paragraph, with
+    _italic_ and ^superscript^ runs marked inline.
+    Adjacent runs with the same formatting are merged whether or not the
+    stream was coalesced, so the output doesn't depend on --no-coalesce.
+    """
+    EXTENSION = ".txt"
+    CONTENT_TYPE = "text/plain; charset=utf-8"
+    _markers = {
+        0: ("", ""),
+        TokenStream.ITALIC: ("_", "_"),
+        TokenStream.SUPERSCRIPT: ("^", "^"),
+        TokenStream.ITALIC | TokenStream.SUPERSCRIPT: ("_^", "^_"),
+    }
+
+    def write(self, stream, path_or_file):
+        _write_output(self.render(stream).encode("utf_8"), path_or_file)
+
+    def render(self, stream):
+        lines = []
+        for runs in stream.paragraphs():
+            line = []
+            for text, flags in TokenStream.coalesced(runs):
+                start, end = self._markers[flags]
+                line.append(start + text + end)
+            lines.append("".join(line))
+        return "\n".join(lines) + "\n"
+
+
+class HtmlWriter(object):
+    """
+    Writes a TokenStream as a minimal HTML page: one <p> per docx paragraph,
+    with <i> and <sup> runs. Whitespace is kept as it is in the docx.
+    Runs are merged like TextWriter does.
+    """
+    EXTENSION = ".html"
+    CONTENT_TYPE = "text/html; charset=utf-8"
+    HEAD = ('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            '<style>p { margin: 0; white-space: pre-wrap; }</style>\n</head>\n<body>\n')
+    TAIL = "</body>\n</html>\n"
+    _tags = {
+        0: ("", ""),
+        TokenStream.ITALIC: ("<i>", "</i>"),
+        TokenStream.SUPERSCRIPT: ("<sup>", "</sup>"),
+        TokenStream.ITALIC | TokenStream.SUPERSCRIPT: ("<i><sup>", "</sup></i>"),
+    }
+
+    def write(self, stream, path_or_file):
+        _write_output(self.render(stream).encode("utf_8"), path_or_file)
+
+    def render(self, stream):
+        html = [self.HEAD]
+        for runs in stream.paragraphs():
+            html.append("<p>")
+            for text, flags in TokenStream.coalesced(runs):
+                start, end = self._tags[flags]
+                html.append(start + xml_escape(text) + end)
+            html.append("</p>\n")
+        html.append(self.TAIL)
+        return "".join(html)
+
+
+class JsonlWriter(object):
+    """
+    Writes a TokenStream as JSON lines, one per docx paragraph:
+        {"text": ..., "spans": [{"text": ..., "italic": ..., "superscript": ...}, ...]}
+    Runs are merged like TextWriter does.
+    """
+    EXTENSION = ".jsonl"
+    CONTENT_TYPE = "application/jsonl; charset=utf-8"
+
+    def write(self, stream, path_or_file):
+        _write_output(self.render(stream).encode("utf_8"), path_or_file)
+
+    def render(self, stream):
+        lines = []
+        for runs in stream.paragraphs():
+            spans = [{"text": text, "italic": bool(flags & TokenStream.ITALIC),
+                      "superscript": bool(flags & TokenStream.SUPERSCRIPT)}
+                     for text, flags in TokenStream.coalesced(runs)]
+            lines.append(json.dumps({"text": "".join(span["text"] for span in spans), "spans": spans},
+                                    ensure_ascii=False))
+        return "\n".join(lines) + "\n"
+
+
+# Output formats besides docx (whose writer is picked from WRITERS)
+FORMATS = {
+    "txt": TextWriter,
+    "html": HtmlWriter,
+    "jsonl": JsonlWriter,
+}
+
+
+class Profiler(object):
+    """
+    Class to collect where the time goes during a run: wall and CPU time per
+    stage (loading, parsing, scraping, printing, saving...) overall and per
+    text, plus counts and time per gdl node kind and per d-node type.
+    Workers each keep their own Profiler and hand back to_dict(), which the
+    parent folds in with merge().
+    Stages in NESTED_STAGES run inside another stage (scraping happens while
+    parsing), so they're left out of a text's total.
+    """
+    NESTED_STAGES = ("scrape",)
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> [count, wall, cpu]
+        self.texts = {}  # textid -> {stage: [wall, cpu]}
+        self.nodes = {}  # (category, kind) -> [count, seconds]
+
+    @staticmethod
+    def clock():
+        return time.perf_counter(), time.process_time()
+
+    def add_stage(self, name, start, textid=None):
+        """Records a stage that began at start (as returned by clock()).
+        Args:
+            name (str): stage name, eg. "parse"
+            start (tuple (float, float)): wall and CPU clock when the stage began
+            textid (str): text the stage ran for, if any
+        """
+        wall = time.perf_counter() - start[0]
+        cpu = time.process_time() - start[1]
+        self._add_stage(name, 1, wall, cpu, textid)
+
+    @contextlib.contextmanager
+    def stage(self, name, textid=None):
+        start = self.clock()
         try:
-            catalogue_path = os.path.join(os.path.dirname(json_path), "..", "catalogue.json")
-            return self._read_json_dict(catalogue_path)
-        except Exception as e:
-            print("Unable to find catalogue.json at {0}.".format(catalogue_path))
-            raise e
+            yield
+        finally:
+            self.add_stage(name, start, textid)
 
-    def _read_json_dict(self, filename):
-        with open(filename) as fd:
-            raw_str = fd.read()
-            return json.loads(raw_str)
+    def add_node(self, category, kind, seconds):
+        """Records one node handled in the given number of seconds.
+        Args:
+            category (str): "gdl" or "d"
+            kind (str): gdl node kind (eg. "det") or d-node type (eg. "line-start")
+            seconds (float): time spent handling the node
+        """
+        counter = self.nodes.get((category, kind))
+        if counter is None:
+            self.nodes[(category, kind)] = [1, seconds]
+        else:
+            counter[0] += 1
+            counter[1] += seconds
+
+    def _add_stage(self, name, count, wall, cpu, textid):
+        counter = self.stages.setdefault(name, [0, 0.0, 0.0])
+        counter[0] += count
+        counter[1] += wall
+        counter[2] += cpu
+        if textid is not None:
+            text_counter = self.texts.setdefault(textid, {}).setdefault(name, [0.0, 0.0])
+            text_counter[0] += wall
+            text_counter[1] += cpu
+
+    def to_dict(self):
+        """Returns everything collected so far as plain JSON-able data,
+        eg. to send back from a worker process.
+        """
+        return {
+            "stages": self.stages,
+            "texts": self.texts,
+            "nodes": [[category, kind, count, seconds] for (category, kind), (count, seconds) in self.nodes.items()],
+        }
+
+    def merge(self, data):
+        """Folds in the to_dict() of another Profiler.
+        """
+        for name, (count, wall, cpu) in data["stages"].items():
+            self._add_stage(name, count, wall, cpu, None)
+        for textid, stages in data["texts"].items():
+            for name, (wall, cpu) in stages.items():
+                text_counter = self.texts.setdefault(textid, {}).setdefault(name, [0.0, 0.0])
+                text_counter[0] += wall
+                text_counter[1] += cpu
+        for category, kind, count, seconds in data["nodes"]:
+            counter = self.nodes.setdefault((category, kind), [0, 0.0])
+            counter[0] += count
+            counter[1] += seconds
+
+    def report(self, top=20):
+        """Builds the report written by write_report().
+        Args:
+            top (int): number of slowest texts and node kinds to single out
+        Returns:
+            dict: stages, texts and node kinds with their counts and times
+        """
+        texts = []
+        for textid, stages in self.texts.items():
+            own_stages = [times for name, times in stages.items() if name not in self.NESTED_STAGES]
+            texts.append({
+                "textid": textid,
+                "wall": sum(wall for wall, cpu in own_stages),
+                "cpu": sum(cpu for wall, cpu in own_stages),
+                "stages": {name: {"wall": wall, "cpu": cpu} for name, (wall, cpu) in stages.items()},
+            })
+        texts.sort(key=lambda text: text["wall"], reverse=True)
+
+        nodes = [{"category": category, "kind": kind, "count": count, "seconds": seconds,
+                  "mean_us": 1e6 * seconds / count}
+                 for (category, kind), (count, seconds) in self.nodes.items()]
+        nodes.sort(key=lambda node: node["seconds"], reverse=True)
+
+        return {
+            "wall": time.perf_counter() - self.started,
+            "stages": {name: {"count": count, "wall": wall, "cpu": cpu}
+                       for name, (count, wall, cpu) in self.stages.items()},
+            "slowest_texts": texts[:top],
+            "slowest_node_kinds": nodes[:top],
+            "nodes": nodes,
+            "texts": texts,
+        }
+
+    def write_report(self, path, top=20):
+        """Writes report() as JSON to path and prints a short summary.
+        """
+        report = self.report(top)
+        with open(path, "w", encoding="utf_8") as fd:
+            json.dump(report, fd, indent=2, ensure_ascii=False)
+
+        print("Profile written to {0} ({1:.2f}s wall)".format(path, report["wall"]))
+        for name, stage in sorted(report["stages"].items(), key=lambda item: item[1]["wall"], reverse=True):
+            print("  {0:<10} {1:5d}x {2:9.3f}s wall {3:9.3f}s cpu".format(name, stage["count"], stage["wall"], stage["cpu"]))
+        for text in report["slowest_texts"][:5]:
+            print("  slow text  {0}: {1:.3f}s".format(text["textid"], text["wall"]))
+        for node in report["slowest_node_kinds"][:5]:
+            print("  slow node  {0} {1}: {2}x, {3:.3f}s".format(node["category"], node["kind"], node["count"], node["seconds"]))
 
 
 class JsonParser(object):
     """
     Class to take in a local JSON file and output a docx.
+    The CDL walk emits a TokenStream, which is only rendered into a docx
+    when saving.
+    Pages needed to fill in incomplete L-nodes are fetched through pages
+    (a PageCache) when one is given, otherwise straight from ORACC.
+    The docx is written by writer (one of WRITERS), python-docx by default;
+    a writer from FORMATS saves the text in another format instead.
+    Adjacent runs with the same formatting are merged unless coalesce_runs is off.
+    Stage and node timings are recorded into profiler (a Profiler) when one is given.
+    The assembled text is only printed to the console with print_text on, and
+    its brackets only counted with bracket_stats on.
+    Verbose messages from the walk over nodes are only logged if DEBUG was
+    on when the parser was made, so a quiet run doesn't even call logger.debug().
+    The docx's file name comes from names (a NameAllocator), which should be
+    shared by every parser saving into the same output_directory. When bundle
+    (a DocxBundle) is given, the docx is added to it instead.
     """
-    def __init__(self, json_dict, output_directory):
+    def __init__(self, json_dict, output_directory, pages=None, writer=None, coalesce_runs=True, profiler=None,
+                 print_text=False, bracket_stats=False, names=None, bundle=None):
         self.cdl_dict = json_dict
         self.output_directory = output_directory
-        self.l_reflist = []  # for repeat nodes
+        self.l_reflist = set()  # for repeat nodes
         self.traversed_first_c_sentence_node = False  # TODO don't need this anymore if we're not using c-labels
         self.found_obverse_or_reverse_d_node = False  # trigger on first type=discourse c-node?
 
@@ -186,32 +1814,53 @@ class JsonParser(object):
         self.primary_publication = json_dict.get("primary_publication") # eg. Esarhaddon 088
         self.museums = json_dict.get("collection") # eg. British Museum, London, UK
 
+        self.pages = pages
+        self.writer = writer or PythonDocxWriter()
+        self.coalesce_runs = coalesce_runs
+        self.profiler = profiler
+        self.print_text = print_text
+        self.bracket_stats = bracket_stats
+        self.names = names or NameAllocator(output_directory)
+        self.bundle = bundle
+        self.output_name = None  # docx file name once saved, "" if there was nothing to save
+        self.missing_page = False  # set when an ORACC page was needed but unavailable (offline, or ORACC failed)
         self.soup = None
         self.has_aramaic = False
+        self.verbose = logger.isEnabledFor(logging.DEBUG)  # checked once per text rather than once per node
 
     def run(self):
         """Loads and parses given ORACC JSON, then saves the pieced-together
         text into a docx on disk.
         """
         if not self.q_number:
-            print_if_verbose("Skipping malformed JSON from {0}:".format(self.cdl_dict["original_path"]))
-            print_if_verbose(self.cdl_dict)
+            logger.debug("Skipping malformed JSON from %s:", self.cdl_dict["original_path"])
+            logger.debug("%s", self.cdl_dict)
+            return
+        logger.debug("Parsing textid %s from project %s", self.q_number, self.cdl_dict["project"])
+        stream = TokenStream(coalesce=self.coalesce_runs)
+        if self.profiler is None:
+            res = self.parse_json(stream)
+            self.print_doc(stream)
+            self.save_docx(stream)
             return
-        print_if_verbose(
-            "Parsing textid {0} from project {1}".format(self.q_number, self.cdl_dict["project"])
-        )
-        doc = Document()
-        res = self.parse_json(doc)
-        self.print_doc(doc)
-        self.save_docx(doc)
 
-    def parse_json(self, doc):
+        with self.profiler.stage("parse", self.q_number):
+            res = self.parse_json(stream)
+        with self.profiler.stage("print_doc", self.q_number):
+            self.print_doc(stream)
+        with self.profiler.stage("save", self.q_number):
+            self.save_docx(stream)
+
+    def parse_json(self, stream):
         """Walks through the JSON object and pieces together all the lemmas.
         No new sections like obverse/reverse yet. TODO complete docstring
 
         dict[cdl] is list
         dict[cdl][3] (or whatever index) has node == c; start parsing there
         dict[cdl][3][cdl] contains list of dicts with actual lemmas/line breaks
+
+        Args:
+            stream (TokenStream): stream to append the parsed text to
         """
         if not self.cdl_dict:
             return
@@ -221,92 +1870,79 @@ class JsonParser(object):
             return
 
         nodes = self.cdl_dict["cdl"]
-        for c_node in nodes:
-            chunk = c_node
-            res = self.traverse_c_node(chunk, doc)
-
-    def save_docx(self, doc):
-        """Attempt to save the resulting docx file to current directory where
-        script originally ran. Resulting docx will either be named after its
-        Q-number textid or its exemplar sources.
+        if isinstance(nodes, CdlReader):  # still to be read from the file
+            self.traverse_events(nodes.events(), stream)
+        else:
+            self.traverse_events(walk_cdl(nodes), stream)
+
+    def save_docx(self, stream):
+        """Attempt to save the resulting docx file to output_directory.
+        Resulting docx will either be named after its Q-number textid or its
+        exemplar sources, made unique by names (see NameAllocator).
         Args:
             #textid (str): ID of original JSON dict; basis of save name
                 (eg. Q003456 -> Q003456.docx)
-            doc (docx.Document): fully assembled docx object to be saved
+            stream (TokenStream): fully parsed text to be rendered and saved
         """
         try:
             # Check first to make sure there's anything worth saving, eg. an empty JSON
-            p_text = ""
-            for p in doc.paragraphs:
-                for r in p.runs:
-                    p_text += r.text
-            p_text = p_text.strip()
-            if not p_text or p_text == "Obverse" or p_text == "Text":
-                print_if_verbose("No text in this docx- skipping save!")
+            if not stream.has_content:
+                logger.debug("No text in this docx- skipping save!")
+                self.output_name = ""
+                return
+
+            prefix = "(arc) " if self.has_aramaic else ""
+            if self.bundle is not None:
+                fd = io.BytesIO()
+                self.writer.write(stream, fd)
+                self.output_name = self.bundle.add(textid=self.q_number, name=self.cdl_dict["docx_name"],
+                                                   prefix=prefix, data=fd.getvalue(), n_lines=len(stream),
+                                                   project=self.cdl_dict.get("project"),
+                                                   extension=self.writer.EXTENSION,
+                                                   ochre_title=self.cdl_dict.get("ochre_title"))
+                logger.debug("Added %s to bundle", self.q_number)
                 return
 
             # Otherwise, go on and save it
-            docx_name = self._get_docx_name_to_save(self.cdl_dict["docx_name"]) + ".docx"
-            if self.has_aramaic:
-                docx_name = "(arc) " + docx_name
-            docx_path = os.path.join(self.output_directory, docx_name)
-            doc.save(docx_path)
-            print("Saved docx in {0}".format(docx_path))
+            docx_name = self.names.allocate(self.cdl_dict["docx_name"], prefix, self.writer.EXTENSION)
         except Exception as e:
             print("Couldn't save docx! {0}".format(e))
+            return
+        docx_path = os.path.join(self.output_directory, docx_name)
+        try:
+            self.writer.write(stream, docx_path)
+        except Exception as e:
+            self.names.release(docx_name)
+            print("Couldn't save docx! {0}".format(e))
+            return
+        self.output_name = docx_name
+        print("Saved {0} in {1}".format(self.writer.EXTENSION[1:], docx_path))
 
-    def _get_docx_name_to_save(self, name):
-        """Check if docx_name would be unique before saving. If not, append the appropriate
-        number identifier. eg. "My Exemplar Name" -> "My Exemplar Name (1)", assuming
-        "My Exemplar Name" exists.
-        """
-        number_id = 0
-        original_name = name
-        docx_name = name
-
-        while True:
-            if not os.path.exists(docx_name + ".docx"):
-                return docx_name
-            print("{0} exists, continuing".format(docx_name))
-            number_id += 1
-            docx_name = original_name + " ({0})".format(number_id)
-
-    def print_doc(self, doc):
-        """Utility function to print resulting fully assembled text to console.
-        There will be no formatting such as italics. Super/subscripts may depend
-        based on your terminal of choice.
+    def print_doc(self, stream):
+        """Utility function to print resulting fully assembled text to console,
+        if print_text is on. There will be no formatting such as italics.
+        Super/subscripts may depend based on your terminal of choice.
+        With bracket_stats on, also prints how many [ ] ⸢ ⸣ the text has.
 
         Args:
-            doc (docx.Document): fully assembled text result to be printed
-        """
-        full_left_brackets = 0
-        full_right_brackets = 0
-        partial_left_brackets = 0
-        partial_right_brackets = 0
-        for p in doc.paragraphs:
-            s = ""
-            for r in p.runs:
-                s += r.text
-                if "[" in r.text:
-                    full_left_brackets += 1
-                elif "]" in r.text:
-                    full_right_brackets += 1
-                elif "⸢" in r.text:
-                    partial_left_brackets += 1
-                elif "⸣" in r.text:
-                    partial_right_brackets += 1
-            print_if_verbose(s)
-
-        # Seeing if we're balanced or not
-        #print_if_verbose("[ count: {0}".format(full_left_brackets))
-        #print_if_verbose("] count: {0}".format(full_right_brackets))
-        #print_if_verbose("⸢ count: {0}".format(partial_left_brackets))
-        #print_if_verbose("⸣ count: {0}".format(partial_left_brackets))
-        #assert(full_left_brackets == full_right_brackets) # TODO restore if you remove exemplar name
-        #assert(partial_left_brackets == partial_right_brackets) # TODO ditto
-        print_if_verbose("--------------------------------------\n")
-
-    def traverse_c_node(self, c_dict, doc, first_c_node=False):
+            stream (TokenStream): fully assembled text result to be printed
+        """
+        if self.print_text:
+            for index in range(len(stream)):
+                print(stream.paragraph_text(index))
+
+        if self.bracket_stats:
+            # Seeing if we're balanced or not; the exemplar name header may hold brackets too
+            text = "".join(stream.texts)
+            counts = [text.count(bracket) for bracket in "[]⸢⸣"]
+            print("Brackets in {0}: [ {1}, ] {2}, ⸢ {3}, ⸣ {4}{5}".format(
+                self.q_number, counts[0], counts[1], counts[2], counts[3],
+                "" if counts[0] == counts[1] and counts[2] == counts[3] else " (unbalanced)"))
+
+        logger.debug("Runs: %s added, %s after coalescing", stream.runs_added, len(stream.texts))
+        logger.debug("--------------------------------------\n")
+
+    def traverse_c_node(self, c_dict, stream, first_c_node=False):
         """Decides what to do for each of the nodes in a c-node's node list.
         Will further traverse down a C(hunk), D(iscontinuity), or L(emma)
         node as needed.
@@ -315,36 +1951,69 @@ class JsonParser(object):
             c_dict (dict): Corresponds to the very first C node encountered
                 in an ORACC JSON. Contains more C, D, or L nodes that may
                 further be nested.
-            doc (docx.Document): docx object to append lemmas to
+            stream (TokenStream): stream to append lemmas to
+        """
+        self.traverse_events(walk_cdl([c_dict]), stream)
+
+    def traverse_events(self, events, stream):
+        """Dispatches every node of a cdl tree from one flat loop, whether
+        the tree is in memory (walk_cdl) or still being read (CdlReader), so
+        deeply nested texts don't recurse.
+        Args:
+            events (iterable (tuple (str, dict))): (kind, node) events, see walk_cdl()
+            stream (TokenStream): stream to append lemmas to
+        """
+        parse_d_node = self.parse_d_node
+        parse_l_node = self.parse_l_node
+        profiler = self.profiler
+        skipping = 0  # depth inside a C-node that's being skipped
+        for kind, node in events:
+            if skipping:
+                if kind == "c":
+                    skipping += 1
+                elif kind == "/c":
+                    skipping -= 1
+            elif kind == "l":
+                parse_l_node(node, stream)
+            elif kind == "d":
+                if profiler is None:
+                    parse_d_node(node, stream)
+                else:
+                    start = time.perf_counter()
+                    parse_d_node(node, stream)
+                    profiler.add_node("d", node["type"], time.perf_counter() - start)
+            elif kind == "c":
+                if not self._enter_c_node(node, stream):
+                    skipping = 1
+            elif kind != "/c":
+                if self.verbose:
+                    logger.debug("Unknown node type for node %s", node)
+
+    def _enter_c_node(self, c_dict, stream):
+        """Handles the start of a C-node, before any of its nodes.
+        Returns:
+            bool: False if the C-node should be skipped altogether
         """
         if not c_dict.get("id", ""):
-            print_if_verbose("No id for this c-node- returning!")
-            return
+            if self.verbose:
+                logger.debug("No id for this c-node- returning!")
+            return False
 
-        print_if_verbose("At c-node {0}".format(c_dict["id"]))
+        if self.verbose:
+            logger.debug("At c-node %s", c_dict["id"])
 
         # If we've reached the point of starting the actual text, ie. no D-nodes
         # with "obverse" or "reverse" have been encountered so far, we still need
         # some header, so we put in "Text"
         if c_dict["type"] == "discourse":
             if not self.found_obverse_or_reverse_d_node:
-                p = doc.add_paragraph()
-                p.add_run("Text")
-                doc.add_paragraph()
+                stream.add_header("Text")
+                stream.add_paragraph()
                 self.found_obverse_or_reverse_d_node = True
+        return True
 
-        for node in c_dict["cdl"]:
-            if node["node"] == "c":
-                self.traverse_c_node(node, doc, first_c_node=False)
-            elif node["node"] == "d":
-                self.parse_d_node(node, doc)
-            elif node["node"] == "l":
-                self.parse_l_node(node, doc)
-            else:
-                print_if_verbose("Unknown node type for node {0}".format(node))
-
-    def parse_d_node(self, d_dict, doc):
-        """Parses a D(iscontinuity) node and adds paragraphs to doc as needed.
+    def parse_d_node(self, d_dict, stream):
+        """Parses a D(iscontinuity) node and adds paragraphs to stream as needed.
         Types of d-node values:
           - line-start
           - obverse
@@ -364,21 +2033,19 @@ class JsonParser(object):
             # We want to keep a text flowing so that there's no empty lines
             # aside from before things like "Reverse"
             try:
-                # Assemble any text from the last run of last paragraph
-                p_text = ""
-                for r in doc.paragraphs[-1].runs:
-                    p_text += r.text
-
-                # If text contains prior D-node, make sure to not add a space!
-                if "Text" in p_text or "Obverse" in p_text or "Reverse" in p_text or "column" in p_text:
-                    print_if_verbose("Last line was a D-node header '{0}', skipping line-start".format(p_text))
+                # If the last paragraph holds a prior D-node's header, make sure to not add a space!
+                if stream.current_has_header:
+                    if self.verbose:
+                        logger.debug("Last line was a D-node header, skipping line-start")
 
-                elif p_text.strip() == "":  # a whitespace-only paragraph
-                    print_if_verbose("Last paragraph was empty, skipping line-start")
+                elif stream.current_is_blank:  # a whitespace-only paragraph
+                    if self.verbose:
+                        logger.debug("Last paragraph was empty, skipping line-start")
 
                 else:
-                    print_if_verbose("Last paragraph was NOT empty. Applying line-start newline.")
-                    doc.add_paragraph()
+                    if self.verbose:
+                        logger.debug("Last paragraph was NOT empty. Applying line-start newline.")
+                    stream.add_paragraph()
             except Exception as e:
                 print("Couldn't get last run before this line-start: {0}".format(e))
             # NOTE: disabled below since this was adding eg. custom line numbers that OCHRE won't be able to parse
@@ -386,45 +2053,44 @@ class JsonParser(object):
             #p.add_run(d_dict.get("label", ""))  # eg. Inscription_A 1 in rinap4/Q003347
 
         elif d_type == "obverse":
-            p = doc.add_paragraph()
             # there'll be at least 2 paragraphs already if "Text" present
             # if "obverse" in the middle and not at start, needs extra newline
-            if len(doc.paragraphs) >= 2:
-                p = doc.add_paragraph()
-            p.add_run("Obverse")
-            doc.add_paragraph()
+            if len(stream) >= 1:
+                stream.add_paragraph()
+            stream.add_header("Obverse")
+            stream.add_paragraph()
             self.found_obverse_or_reverse_d_node = True
 
         elif d_type == "reverse":
             # Needs extra newline before it, unlike obverse, since it comes later on in texts
-            doc.add_paragraph()
-            p = doc.add_paragraph()
-            p.add_run("Reverse")
-            doc.add_paragraph()
+            stream.add_paragraph()
+            stream.add_header("Reverse")
+            stream.add_paragraph()
             self.found_obverse_or_reverse_d_node = True
 
         elif d_type == "punct":
-            p = doc.paragraphs[-1]
-            p.add_run(d_dict["frag"])
-            p.add_run(d_dict.get("delim", ""))
+            stream.add_run(d_dict["frag"])
+            stream.add_run(d_dict.get("delim", ""))
 
         # TODO: below is WIP
         # what happens if the very first element of the paragraph is excised?
         elif d_type == "excised" and "frag" in d_dict:
-            assert(len(doc.paragraphs) > 0)
-            self._add_excised_d_node(d_dict, doc.paragraphs[-1])
+            assert(len(stream) > 0)
+            self._add_excised_d_node(d_dict, stream)
 
         elif d_type == "excised" and "frag" not in d_dict:
-            print_if_verbose("Excised node without frag:")
-            print_if_verbose(d_dict)
+            if self.verbose:
+                logger.debug("Excised node without frag:")
+                logger.debug("%s", d_dict)
 
         elif d_type == "nonx" or d_type == "nonw" or d_type == "object" or d_type == "surface":
             pass
 
         else:
-            print_if_verbose("Unknown or noop d-value {0}".format(d_type))
+            if self.verbose:
+                logger.debug("Unknown or noop d-value %s", d_type)
 
-    def _add_excised_d_node(self, d_dict, paragraph):
+    def _add_excised_d_node(self, d_dict, stream):
         """Add a D-node of type "excised". These nodes don't come with the same members/metadata as L-nodes,
         even if the node's contents have more than one sign in it. Doesn't replace subscript #'s or convert 2/3
         subscripts to accented marks- apparently OCHRE understands that fine.
@@ -452,20 +2118,20 @@ class JsonParser(object):
             elif char.isalpha() or char.isdigit(): # Sumerian or Akkadian, or a subscript #
                 if det_mode and char.islower() and char != "m" and char != "d": # NOTE this assumes only Sumerian determinatives
                     char = char.capitalize() # tested and should work fine with eg. Ğ.
-                r = paragraph.add_run(char)
-                if char.islower():  # Akkadian - set italics
-                    r.italic = True
-                if det_mode:
-                    r.superscript = True
+                # Akkadian - set italics
+                # NOTE: determinatives here never actually came out superscript (this used to set r.superscript,
+                # which isn't a docx property), so they're still left as-is to keep output unchanged
+                stream.add_run(char, italic=char.islower())
             else:  # symbol, probably like - or [ or ], or << <
-                paragraph.add_run(char)
+                stream.add_run(char)
 
-        paragraph.add_run(d_dict.get("delim"))
-        print_if_verbose("Added excised D-node {0}".format(d_dict['frag']))
-        print_if_verbose(d_dict)
+        stream.add_run(d_dict.get("delim"))
+        if self.verbose:
+            logger.debug("Added excised D-node %s", d_dict['frag'])
+            logger.debug("%s", d_dict)
 
-    def parse_l_node(self, l_dict, doc):
-        """Gets L(emma) node text, formats it, and adds it to the last paragraph of doc.
+    def parse_l_node(self, l_dict, stream):
+        """Gets L(emma) node text, formats it, and adds it to the last paragraph of stream.
         L nodes may contain either an Akkadian or Aramaic lemma.
         Example of Akkadian L node which this function will work on (in rinap/rinap1/corpusjson/Q003414.json):
         {
@@ -504,31 +2170,35 @@ class JsonParser(object):
         }
         Args:
             l_dict (dict): dict version of an L node above
-            doc (docx.Document): document object to append lemma to
+            stream (TokenStream): stream to append lemma to
         """
-        print_if_verbose("At L-node {0}".format(l_dict["ref"]))
+        if self.verbose:
+            logger.debug("At L-node %s", l_dict["ref"])
         # Check if this frag's already been added
         ref = l_dict["ref"]
         if ref in self.l_reflist:
-            print_if_verbose("Already added ref {0}, skipping".format(ref))
+            if self.verbose:
+                logger.debug("Already added ref %s, skipping", ref)
             return
         else:
-            self.l_reflist.append(ref)
+            self.l_reflist.add(ref)
 
-        last_paragraph = doc.paragraphs[-1]
         lang = l_dict.get("f").get("lang")
 
         if lang == "arc":  # eg. Aramaic
-            print_if_verbose("Adding Aramaic fragment")
-            self._add_aramaic_frag(l_dict, last_paragraph)
+            if self.verbose:
+                logger.debug("Adding Aramaic fragment")
+            self._add_aramaic_frag(l_dict, stream)
             return
         elif lang == "qcu-949":  # seemingly English...
-            print_if_verbose("Not adding English fragment...")
+            if self.verbose:
+                logger.debug("Not adding English fragment...")
             return
         elif lang != "akk" and lang != "akk-949" and \
                 lang != "akk-x-neoass" and lang != "sux" and \
                 lang != "akk-x-neobab":
-            print_if_verbose("Unrecognized language {0}".format(lang))
+            if self.verbose:
+                logger.debug("Unrecognized language %s", lang)
 
         # TODO: I dunno what to do for this...
         gdl_list = l_dict.get("f", "").get("gdl", "")
@@ -537,64 +2207,101 @@ class JsonParser(object):
             # However, contents of f is not usable- it's often an assembled Akkadian word
             # rather than transliterated version (eg. bilticu vs. GUN-cu).
             # We'll have to use the online version at this point using the ref #
-            print("INCOMPLETE TEXT starting at {0}- scraping web equivalent at http://oracc.museum.upenn.edu/{1}/{2}".format(l_dict["ref"], self.project, self.q_number))
-            print_if_verbose("Raw fragment is {0}".format(l_dict["frag"]))
-            self._scrape_incomplete_l_node(l_dict["ref"], last_paragraph)
+            print("INCOMPLETE TEXT starting at {0}- scraping web equivalent at {1}".format(l_dict["ref"], self._page_url()))
+            if self.verbose:
+                logger.debug("Raw fragment is %s", l_dict["frag"])
+            if self.profiler is None:
+                self._scrape_incomplete_l_node(l_dict["ref"], stream)
+            else:
+                with self.profiler.stage("scrape", self.q_number):
+                    self._scrape_incomplete_l_node(l_dict["ref"], stream)
             return
 
+        profiler = self.profiler
         for index in range(len(gdl_list)):
-            node_dict = gdl_list[index]
-            if "s" in node_dict:
-                self._add_logogram(node_dict, last_paragraph)
-            elif "v" in node_dict:
-                self._add_continuing_sign_form(node_dict, last_paragraph)
-            elif "det" in node_dict:
-                # NOTE: if there's 2 determinatives stuck next to each other,
-                # need to separate them with space or something else
-                # since OCHRE will otherwise attempt to look up
-                # eg. "md" instead of "m" and "d" dets separately
-                try:
-                    if len(gdl_list) > index + 1 and "det" in gdl_list[index + 1]:
-                        self._add_determinative(node_dict, last_paragraph, add_dot_delim=True)
-                        print_if_verbose("Added first in set of multiple DETs")
-                    else:
-                        self._add_determinative(node_dict, last_paragraph)
-                except Exception as e:
-                    print("Looks like a single determinative, not 2 stuck together! Exception: {0}".format(e))
-                    raise e # NOTE keeping this around for debug purposes; this ideally should never hit
-            elif "gg" in node_dict:
-                self._add_logogram_cluster(node_dict, last_paragraph)
-            elif "x" in node_dict:
-                self._add_ellipsis(node_dict, last_paragraph)
-            elif "n" in node_dict:
-                self._add_number(node_dict, last_paragraph)
-            elif "q" in node_dict:
-                # TODO add dedicated function
-                d_dict = {
-                    "frag": node_dict["q"].replace("|", ""),
-                    "delim": node_dict.get("delim"),
-                }
-                self._add_excised_d_node(d_dict, last_paragraph)
-                print_if_verbose("Added qualified element {0} via parse_l_node".format(node_dict["q"]))
-            elif "c" in node_dict:
-                # TODO add dedicated function
-                c_frag = node_dict["c"].replace("|", "")
-                last_paragraph.add_run(c_frag + node_dict.get("delim"))
-                print_if_verbose("Added composite fragment {0}".format(node_dict['c']))
-            elif "mods" in node_dict:
-                self._add_pre_frag_symbols(node_dict, last_paragraph)
-                frag = node_dict["form"]
-                r = last_paragraph.add_run(frag)
-                if frag.islower():
-                    r.italic = True
-                self._add_post_frag_symbols(node_dict, last_paragraph)
-                last_paragraph.add_run(node_dict.get("delim", ""))
-                print_if_verbose("Added mods L-node {0}".format(node_dict["form"]))
+            if profiler is None:
+                self._add_gdl_node(gdl_list, index, stream)
             else:
-                print_if_verbose("Unknown l-node {0}".format(node_dict))
-        last_paragraph.add_run(l_dict["f"].get("delim", "")) # TODO still needed?
+                start = time.perf_counter()
+                kind = self._add_gdl_node(gdl_list, index, stream)
+                profiler.add_node("gdl", kind, time.perf_counter() - start)
+        stream.add_run(l_dict["f"].get("delim", "")) # TODO still needed?
+
+    def _add_gdl_node(self, gdl_list, index, stream):
+        """Adds the gdl node at gdl_list[index] of an L-node to stream, going by
+        which kind of sign it is.
+        Args:
+            gdl_list (list (dict)): gdl member of an L-node's f
+            index (int): position of the node to add; its neighbours decide
+                how determinatives are separated
+            stream (TokenStream): stream to append the sign to
+        Returns:
+            str: kind of gdl node, eg. "s" or "det" (None if unknown)
+        """
+        node_dict = gdl_list[index]
+        if "s" in node_dict:
+            self._add_logogram(node_dict, stream)
+            return "s"
+        elif "v" in node_dict:
+            self._add_continuing_sign_form(node_dict, stream)
+            return "v"
+        elif "det" in node_dict:
+            # NOTE: if there's 2 determinatives stuck next to each other,
+            # need to separate them with space or something else
+            # since OCHRE will otherwise attempt to look up
+            # eg. "md" instead of "m" and "d" dets separately
+            try:
+                if len(gdl_list) > index + 1 and "det" in gdl_list[index + 1]:
+                    self._add_determinative(node_dict, stream, add_dot_delim=True)
+                    if self.verbose:
+                        logger.debug("Added first in set of multiple DETs")
+                else:
+                    self._add_determinative(node_dict, stream)
+            except Exception as e:
+                print("Looks like a single determinative, not 2 stuck together! Exception: {0}".format(e))
+                raise e # NOTE keeping this around for debug purposes; this ideally should never hit
+            return "det"
+        elif "gg" in node_dict:
+            self._add_logogram_cluster(node_dict, stream)
+            return "gg"
+        elif "x" in node_dict:
+            self._add_ellipsis(node_dict, stream)
+            return "x"
+        elif "n" in node_dict:
+            self._add_number(node_dict, stream)
+            return "n"
+        elif "q" in node_dict:
+            # TODO add dedicated function
+            d_dict = {
+                "frag": node_dict["q"].replace("|", ""),
+                "delim": node_dict.get("delim"),
+            }
+            self._add_excised_d_node(d_dict, stream)
+            if self.verbose:
+                logger.debug("Added qualified element %s via parse_l_node", node_dict["q"])
+            return "q"
+        elif "c" in node_dict:
+            # TODO add dedicated function
+            c_frag = node_dict["c"].replace("|", "")
+            stream.add_run(c_frag + node_dict.get("delim"))
+            if self.verbose:
+                logger.debug("Added composite fragment %s", node_dict['c'])
+            return "c"
+        elif "mods" in node_dict:
+            self._add_pre_frag_symbols(node_dict, stream)
+            frag = node_dict["form"]
+            stream.add_run(frag, italic=frag.islower())
+            self._add_post_frag_symbols(node_dict, stream)
+            stream.add_run(node_dict.get("delim", ""))
+            if self.verbose:
+                logger.debug("Added mods L-node %s", node_dict["form"])
+            return "mods"
+        else:
+            if self.verbose:
+                logger.debug("Unknown l-node %s", node_dict)
+            return None
 
-    def _scrape_incomplete_l_node(self, ref_id, paragraph):
+    def _scrape_incomplete_l_node(self, ref_id, stream):
         """For L-nodes that have no gdl_dict and must rely on their online counterparts in ORACC
         to get inputted properly. Usually from ribo/babylon6.
         eg. from http://oracc.museum.upenn.edu/rinap/rinap1/Q003418/html:
@@ -608,15 +2315,23 @@ class JsonParser(object):
         </span>
         NOTE: ref_id isn't guaranteed to be in the web equivalent, let's ignore it if it's missing
         """
-        url = "http://oracc.museum.upenn.edu/{0}/{1}".format(self.project, self.q_number)
+        url = self._page_url()
 
         if not self.soup: # lazy load
-            self.soup = BeautifulSoup(requests.get(url).content, "html.parser")
+            if self.pages:
+                content = self.pages.get_page(self.project, self.q_number)
+                if content is None: # offline and not cached, or not fetched; leave the L-nodes out
+                    content = ""
+                    self.missing_page = True
+            else:
+                content = requests.get(url, timeout=REQUEST_TIMEOUT).content
+            self.soup = BeautifulSoup(content, "html.parser")
 
         parent = self.soup.find("span", {"id": ref_id}) # Assume only 1 span with this ID
 
         if not parent:
-            print_if_verbose("Skipping this ID scrape - id {0} not in web equivalent".format(ref_id))
+            if self.verbose:
+                logger.debug("Skipping this ID scrape - id %s not in web equivalent", ref_id)
             return
 
         if parent.a: # eg. http://oracc.museum.upenn.edu/suhu/Q006238 has no <a> below
@@ -627,24 +2342,34 @@ class JsonParser(object):
         for snippet in parent:
             if type(snippet) is bs4.element.Tag: # is a <span> or <sup>
                 if snippet.text == "?": # Online ORACC has superscript ?, but we want non-superscript (?)
-                    r = paragraph.add_run("(?)")
-                    print_if_verbose("Adding ? sup snippet as non-superscript (?)")
+                    stream.add_run("(?)")
+                    if self.verbose:
+                        logger.debug("Adding ? sup snippet as non-superscript (?)")
                     continue
-                r = paragraph.add_run(snippet.text)
                 if snippet.name == "sup":
-                    r.font.superscript = True
-                    print_if_verbose("Adding scraped determinative {}".format(snippet.text))
+                    stream.add_run(snippet.text, superscript=True)
+                    if self.verbose:
+                        logger.debug("Adding scraped determinative %s", snippet.text)
                 elif snippet.name == "span" and "akk" in snippet["class"]:
-                    r.italic = True
-                    print_if_verbose("Adding scraped Akkadian {}".format(snippet.text))
+                    stream.add_run(snippet.text, italic=True)
+                    if self.verbose:
+                        logger.debug("Adding scraped Akkadian %s", snippet.text)
                 else:
-                    print_if_verbose("Adding scraped Sumerian {}".format(snippet.text))
+                    stream.add_run(snippet.text)
+                    if self.verbose:
+                        logger.debug("Adding scraped Sumerian %s", snippet.text)
             elif type(snippet) is bs4.element.NavigableString: # is just filler chars like [
-                r = paragraph.add_run(snippet)
-                print_if_verbose("Adding scraped etc character {}".format(snippet))
-        paragraph.add_run(" ") # assumed delim afterwards
+                stream.add_run(str(snippet)) # plain str so the stream doesn't keep the soup alive
+                if self.verbose:
+                    logger.debug("Adding scraped etc character %s", snippet)
+        stream.add_run(" ") # assumed delim afterwards
+
+    def _page_url(self):
+        if self.pages:
+            return self.pages.page_url(self.project, self.q_number)
+        return "{0}/{1}/{2}".format(ORACC_URL, self.project, self.q_number)
 
-    def _add_aramaic_frag(self, l_node, paragraph):
+    def _add_aramaic_frag(self, l_node, stream):
         """Adds Aramaic fragment to current paragraph with all needed formatting.
         Example of Aramaic L node which this function will work on (in rinap/rinap1/corpusjson/Q003633.json):
         {
@@ -660,18 +2385,16 @@ class JsonParser(object):
         }
         Args:
             l_node (dict): Aramaic lang node to be added
-            paragraph (docx.text.paragraph.Paragraph): paragraph to add Aramaic fragment to
+            stream (TokenStream): stream to add Aramaic fragment to
         """
         frag = l_node.get("frag", "")
         for char in frag:
-            r = paragraph.add_run(char)
-            if char.isalpha():
-                r.italic = True
+            stream.add_run(char, italic=char.isalpha())
         # Aramaic nodes have no "delim", but should be separated with space
-        paragraph.add_run(" ")
+        stream.add_run(" ")
         self.has_aramaic = True
 
-    def _add_continuing_sign_form(self, gdl_node, paragraph):
+    def _add_continuing_sign_form(self, gdl_node, stream):
         """Adds eg. tu- to the current paragraph.
         eg.
         {
@@ -681,18 +2404,16 @@ class JsonParser(object):
           "delim": "-"
         }
         """
-        self._add_pre_frag_symbols(gdl_node, paragraph)
+        self._add_pre_frag_symbols(gdl_node, stream)
 
         # Actual sign/word fragment
         word = self._convert_2_or_3_subscript(gdl_node["v"])
-        r = paragraph.add_run(word)
-        if word.islower():
-            r.italic = True
-        ##print_if_verbose("Added continuing sign {0}".format(word))
+        stream.add_run(word, italic=word.islower())
+        ##logger.debug("Added continuing sign %s", word)
 
-        self._add_post_frag_symbols(gdl_node, paragraph)
+        self._add_post_frag_symbols(gdl_node, stream)
 
-    def _add_determinative(self, gdl_node, paragraph, add_dot_delim=False):
+    def _add_determinative(self, gdl_node, stream, add_dot_delim=False):
         """Adds determinative to given paragraph and adds necessary styling.
         Example of a node that this would work on (from rinap/rinap1/corpusjson/Q003414.json):
         {
@@ -712,8 +2433,7 @@ class JsonParser(object):
         Args:
             gdl_node (dict): dict representation of a "det" node. These will
                 always occur as a member of a L(emma) node's gdl list.
-            paragraph (docx.text.paragraph.Paragraph): Paragraph object
-                that will append the new determinative
+            stream (TokenStream): stream that will append the new determinative
         """
         assert(gdl_node.get("det", "") == "semantic" or
                gdl_node.get("det", "") == "phonetic")
@@ -721,41 +2441,46 @@ class JsonParser(object):
         if gdl_node["pos"] == "pre" or gdl_node["pos"] == "post":
             det_node = gdl_node["seq"][0] # TODO assumes seq dict only has 1 member- seems true so far...
 
-            self._add_pre_frag_symbols(det_node, paragraph) # TODO document why det node passed in
+            self._add_pre_frag_symbols(det_node, stream) # TODO document why det node passed in
 
             # Add the determinative to paragraph with needed stylings
             if "s" in det_node: # traditional DET node
                 det = det_node["s"]
-                print_if_verbose("Adding regular det form {0}".format(det))
+                if self.verbose:
+                    logger.debug("Adding regular det form %s", det)
             elif "v" in det_node: # alt to first; esp. for ones like m or d
                 det = det_node["v"]
-                print_if_verbose("Adding alternative det form {0}".format(det))
+                if self.verbose:
+                    logger.debug("Adding alternative det form %s", det)
             elif "mods" in det_node: # eg. LU2~v
                 det = det_node["form"]
-                print_if_verbose("Adding MODS det form {0}".format(det))
+                if self.verbose:
+                    logger.debug("Adding MODS det form %s", det)
             elif "n" in det_node: # numeral det, eg. 1(dic)
                 # The 1 det is actually the same as m... compare saa19/x900013 online and in json
                 det = det_node["form"]
                 if det == "1":
                     det = "m"
-                print_if_verbose("Adding numeral det {0}".format(det))
+                if self.verbose:
+                    logger.debug("Adding numeral det %s", det)
             else:
-                print_if_verbose("Unknown DET type: {0}".format(det_node))
+                if self.verbose:
+                    logger.debug("Unknown DET type: %s", det_node)
 
             det = self._convert_2_or_3_subscript(det)
-            r = paragraph.add_run(det)
-            r.font.superscript = True
+            stream.add_run(det, superscript=True)
 
-            self._add_post_frag_symbols(det_node, paragraph)
+            self._add_post_frag_symbols(det_node, stream)
             if add_dot_delim:  # if there's another det right after this
-                r = paragraph.add_run(".")  # TODO use . or space? Space looked a bit weird, so let's try .
-                r.font.superscript = True
-                print_if_verbose("Added extra . delim for double determinative:")
-                print_if_verbose(gdl_node)
+                stream.add_run(".", superscript=True)  # TODO use . or space? Space looked a bit weird, so let's try .
+                if self.verbose:
+                    logger.debug("Added extra . delim for double determinative:")
+                    logger.debug("%s", gdl_node)
         else:
-            print_if_verbose("Unknown determinative position {0}".format(gdl_node["pos"]))
+            if self.verbose:
+                logger.debug("Unknown determinative position %s", gdl_node["pos"])
 
-    def _add_logogram(self, gdl_node, paragraph):
+    def _add_logogram(self, gdl_node, stream):
         """Adds a standalone logogram to current paragraph, eg. LUGAL.
         Example L(emma) node (from rinap/rinap1/corpusjson/Q003627.json):
         {
@@ -782,18 +2507,19 @@ class JsonParser(object):
         """
         assert(gdl_node.get("s", ""))
         if gdl_node.get("role", "") != "logo":
-            print_if_verbose("Non-logo logogram found! {0}".format(gdl_node["s"]))
+            if self.verbose:
+                logger.debug("Non-logo logogram found! %s", gdl_node["s"])
 
-        self._add_pre_frag_symbols(gdl_node, paragraph)
+        self._add_pre_frag_symbols(gdl_node, stream)
 
         # Add actual logogram
         logogram = self._convert_2_or_3_subscript(gdl_node["s"])
-        paragraph.add_run(logogram)
-        ##print_if_verbose("Added logogram {0}".format(logogram))
+        stream.add_run(logogram)
+        ##logger.debug("Added logogram %s", logogram)
 
-        self._add_post_frag_symbols(gdl_node, paragraph)
+        self._add_post_frag_symbols(gdl_node, stream)
 
-    def _add_logogram_cluster(self, gdl_node, paragraph):
+    def _add_logogram_cluster(self, gdl_node, stream):
         """Adds >1 logograms to current paragraph, eg. GIC.TUG.PI.
         Example L(emma) node containing gdl node "gdl" (from rinap/rinap1/corpusjson/Q003627.json):
         {
@@ -832,61 +2558,70 @@ class JsonParser(object):
             ], # end gdl_node
             ...
         }
+        Nested clusters (eg. ligatures) are walked with a stack of the clusters
+        we're inside of instead of recursing; each one's delim is added once
+        all its signs are.
         """
-        logo_group_dict = gdl_node["group"]
-        for logo_dict in logo_group_dict:
-            if "s" in logo_dict:
-                self._add_logogram(logo_dict, paragraph)
-            elif "det" in logo_dict:
-                self._add_determinative(logo_dict, paragraph)
-            elif "v" in logo_dict:
-                self._add_continuing_sign_form(logo_dict, paragraph)
-            elif "n" in logo_dict:
-                self._add_number(logo_dict, paragraph)
-            elif "gg" in logo_dict:
-                self._add_logogram_cluster(logo_dict, paragraph) # eg. for ligatures
-            elif "x" in logo_dict:
-                self._add_ellipsis(logo_dict, paragraph)
-            elif "q" in logo_dict:
-                # TODO add dedicated function for this
-                d_dict = {
-                    "frag": logo_dict["q"].replace("|", ""),
-                    "delim": logo_dict.get("delim"),
-                }
-                self._add_excised_d_node(d_dict, paragraph)
-                print_if_verbose("Added qualified element {0}".format(logo_dict["q"]))
-            elif "c" in logo_dict:
-                # TODO: add dedicated function for this
-                c_frag = logo_dict["c"].replace("|", "")
-                paragraph.add_run(c_frag + logo_dict.get("delim"))
-                print_if_verbose("Added composite fragment {0}".format(c_frag))
-            elif "mods" in logo_dict:
-                # TODO add dedicated function for this
-                self._add_pre_frag_symbols(logo_dict, paragraph)
-                frag = logo_dict["form"]
-                r = paragraph.add_run(frag)
-                if frag.islower():
-                    r.italic = True
-                self._add_post_frag_symbols(logo_dict, paragraph)
-                paragraph.add_run(logo_dict.get("delim", ""))
-                print_if_verbose("Added MODS logo cluster {0}".format(logo_dict["form"]))
-            else:
-                print_if_verbose("Non-sign or determinative found in logogram cluster {0}".format(logo_dict))
-        paragraph.add_run(gdl_node.get("delim", "")) # delim after the cluster
+        stack = [(iter(gdl_node["group"]), gdl_node)]
+        while stack:
+            for logo_dict in stack[-1][0]:
+                if "s" in logo_dict:
+                    self._add_logogram(logo_dict, stream)
+                elif "det" in logo_dict:
+                    self._add_determinative(logo_dict, stream)
+                elif "v" in logo_dict:
+                    self._add_continuing_sign_form(logo_dict, stream)
+                elif "n" in logo_dict:
+                    self._add_number(logo_dict, stream)
+                elif "gg" in logo_dict: # eg. for ligatures
+                    # go down into this cluster; the rest of this one is resumed once it's done
+                    stack.append((iter(logo_dict["group"]), logo_dict))
+                    break
+                elif "x" in logo_dict:
+                    self._add_ellipsis(logo_dict, stream)
+                elif "q" in logo_dict:
+                    # TODO add dedicated function for this
+                    d_dict = {
+                        "frag": logo_dict["q"].replace("|", ""),
+                        "delim": logo_dict.get("delim"),
+                    }
+                    self._add_excised_d_node(d_dict, stream)
+                    if self.verbose:
+                        logger.debug("Added qualified element %s", logo_dict["q"])
+                elif "c" in logo_dict:
+                    # TODO: add dedicated function for this
+                    c_frag = logo_dict["c"].replace("|", "")
+                    stream.add_run(c_frag + logo_dict.get("delim"))
+                    if self.verbose:
+                        logger.debug("Added composite fragment %s", c_frag)
+                elif "mods" in logo_dict:
+                    # TODO add dedicated function for this
+                    self._add_pre_frag_symbols(logo_dict, stream)
+                    frag = logo_dict["form"]
+                    stream.add_run(frag, italic=frag.islower())
+                    self._add_post_frag_symbols(logo_dict, stream)
+                    stream.add_run(logo_dict.get("delim", ""))
+                    if self.verbose:
+                        logger.debug("Added MODS logo cluster %s", logo_dict["form"])
+                else:
+                    if self.verbose:
+                        logger.debug("Non-sign or determinative found in logogram cluster %s", logo_dict)
+            else:  # done with this cluster
+                stream.add_run(stack.pop()[1].get("delim", "")) # delim after the cluster
 
-    def _add_ellipsis(self, gdl_node, paragraph):
+    def _add_ellipsis(self, gdl_node, stream):
         """Adds in things like (...), [...]
         """
         assert(gdl_node.get("x") == "ellipsis")
 
-        self._add_pre_frag_symbols(gdl_node, paragraph)
-        paragraph.add_run("...")
-        self._add_post_frag_symbols(gdl_node, paragraph)
+        self._add_pre_frag_symbols(gdl_node, stream)
+        stream.add_run("...")
+        self._add_post_frag_symbols(gdl_node, stream)
 
-    def _add_number(self, gdl_node, paragraph):
+    def _add_number(self, gdl_node, stream):
         """Adds a number to current paragraph, eg. 4.
         """
-        self._add_pre_frag_symbols(gdl_node, paragraph)
+        self._add_pre_frag_symbols(gdl_node, stream)
         num = gdl_node["form"]
         if num == "1/2":
             num = "½"
@@ -894,21 +2629,21 @@ class JsonParser(object):
             num = "⅓"
         elif num == "2/3":
             num = "⅔"
-        paragraph.add_run(num)
-        self._add_post_frag_symbols(gdl_node, paragraph)
+        stream.add_run(num)
+        self._add_post_frag_symbols(gdl_node, stream)
 
-        #print_if_verbose("Added number {0}".format(gdl_node["form"]))
+        #logger.debug("Added number %s", gdl_node["form"])
 
-    def _add_pre_frag_symbols(self, gdl_node, paragraph):
+    def _add_pre_frag_symbols(self, gdl_node, stream):
         """Adds any symbols that come before the actual text fragment.
         These chars may be added: [ ⸢ < <<
         Args:
             gdl_node (dict): dict of L(emma) node's "gdl" property TODO not for det!
-            paragraph (docx.text.paragraph.Paragraph): paragraph to add to
+            stream (TokenStream): stream to add to
         """
         # Full fragment break start
         if gdl_node.get("breakStart", ""):
-            paragraph.add_run("[")
+            stream.add_run("[")
 
         # o for whatever reason may include [ or ], but this is already taken
         # care of by breakStart and breakEnd. Leave o to just be eg. ( ) < >>
@@ -917,31 +2652,30 @@ class JsonParser(object):
             # o needs to be mirrored first to be an opener frag like ( or < or <<
             o_frag = o_frag.replace("<<", "«").replace("<", "‹").replace(">>", "»").replace(">", "›").replace("$", "")
             o_mirror = closing_punct_mirror[o_frag]
-            paragraph.add_run(o_mirror)
+            stream.add_run(o_mirror)
 
         elif gdl_node.get("statusStart", "") == 1:
             # o should already be an opener frag like ( or < or <<
-            paragraph.add_run(o_frag)
+            stream.add_run(o_frag)
 
         # Partial fragment break start
         if gdl_node.get("ho", ""):
-            paragraph.add_run("⸢") # note: may look inverted on P50, but it's normal, I assure you
+            stream.add_run("⸢") # note: may look inverted on P50, but it's normal, I assure you
 
-    def _add_post_frag_symbols(self, gdl_node, paragraph):
+    def _add_post_frag_symbols(self, gdl_node, stream):
         """Adds any symbols that come after the actual text fragment.
         These chars may be added: ? ⸣ > >>
         Args:
             gdl_node (dict): dict of L(emma) node's "gdl" property
-            paragraph (docx.text.paragraph.Paragraph): paragraph to add to
+            stream (TokenStream): stream to add to
         """
         # Unknown/uncertain sign
         if gdl_node.get("queried", ""):
-            r = paragraph.add_run("(?)")
-            #r.font.superscript = True
+            stream.add_run("(?)") # not superscript, unlike online ORACC
 
         # Partial fragment break end
         if gdl_node.get("hc", ""):
-            paragraph.add_run("⸣") # note: may look inverted on P50, but it's normal, I assure you
+            stream.add_run("⸣") # note: may look inverted on P50, but it's normal, I assure you
 
         # o for whatever reason may include [ or ], but this is already taken
         # care of by breakStart and breakEnd. Leave o to just be eg. ( ) < >>
@@ -949,18 +2683,18 @@ class JsonParser(object):
         if "id" in gdl_node and gdl_node.get("statusStart", "") == gdl_node["id"]:
             # o should already be a closer frag like ) or > or >>
             o_frag = o_frag.replace("<<", "«").replace("<", "‹").replace(">>", "»").replace(">", "›").replace("$", "")
-            paragraph.add_run(o_frag)
+            stream.add_run(o_frag)
 
         # Full fragment break end
         if gdl_node.get("breakEnd", ""):
-            paragraph.add_run("]")
+            stream.add_run("]")
 
         # Whatever delimiter follows, eg. - or space
         if gdl_node.get("delim", ""):
             if gdl_node.get("delim") == "/": # eg. AB / BA needs spacing around / to parse correctly
-                paragraph.add_run(" {0} ".format(gdl_node.get("delim")))
+                stream.add_run(" {0} ".format(gdl_node.get("delim")))
             else:
-                paragraph.add_run(gdl_node["delim"])
+                stream.add_run(gdl_node["delim"])
 
     def _convert_2_or_3_subscript(self, sign):
         """Converts a sign containing a numerical 2 or 3 subscript to have its
@@ -993,7 +2727,8 @@ class JsonParser(object):
                 if char.isupper():
                     accented_char = accented_char.upper()
                 return sign[:-1].replace(char, accented_char, 1)
-        print_if_verbose("You shouldn't be here!")
+        if self.verbose:
+            logger.debug("You shouldn't be here!")
         return sign
 
     def _convert_h(self, sign):
@@ -1046,9 +2781,7 @@ class HtmlParser(object):
         catalogue_dict = {}
 
         try:
-            with open(self.catalogue_path, encoding="utf_8_sig") as fd:
-                raw_str = fd.read()
-                catalogue_dict = json.loads(raw_str)
+            catalogue_dict = read_json_file(self.catalogue_path)
         except Exception as e:
             raise e("Catalogue at {0} not found or unreadable: {1}".format(self.catalogue_path, e))
 
@@ -1139,6 +2872,559 @@ class HtmlParser(object):
         pass
 
 
+_worker_loader = None
+_worker_pages = None
+_worker_writer = None
+_worker_names = None
+_worker_args = None
+
+
+def _init_worker(args):
+    """Pool initializer so that workers pick up the verbose setting even on
+    platforms that spawn rather than fork (ie. Windows). Each worker gets its
+    own lazy JsonLoader, catalogue registry and page cache (sqlite connections
+    can't be shared between processes), and its own name
+    allocator (names are reserved on disk, so workers can't hand out the same one).
+    """
+    global _worker_loader, _worker_pages, _worker_writer, _worker_names, _worker_args
+    configure_logging(args.verbose)
+    set_json_backend(args.json_backend)
+    _worker_args = args
+    _worker_loader = JsonLoader(args.file, lazy=True, catalogues=CatalogueRegistry(args.cache_directory),
+                                stream_cdl=args.stream_json)
+    _worker_pages = _make_page_cache(args)
+    _worker_names = NameAllocator(args.output_directory)
+    _worker_writer = _writer_class(args)()
+
+
+def _convert_json_path(json_path):
+    """Loads and converts a single JSON in a worker process. Anything the
+    parser prints is captured and handed back so that the parent can report
+    it in one piece under the text's ID instead of interleaving it with other
+    workers' output.
+    Args:
+        json_path (str): path to one ORACC JSON file
+    Returns:
+        tuple (str, str, dict, str, list, list): json_path, everything printed
+            while converting it, its Profiler.to_dict() when profiling
+            (otherwise None), the JsonParser's output_name (None if it
+            shouldn't be recorded in the manifest), with --bundle the
+            DocxBundle.add() arguments of the docx for the parent to add, and
+            the pages it found missing from the cache while offline
+    """
+    textid = json_path
+    output_name = None
+    n_misses = len(_worker_pages.misses)
+    log = io.StringIO()
+    profiler = Profiler() if _worker_args.profile else None
+    collector = DocumentCollector() if _worker_args.bundle else None
+    with contextlib.redirect_stdout(log):
+        try:
+            json_dict = _load_json_dict(_worker_loader, json_path, profiler)
+            textid = json_dict.get("textid", textid)
+            jp = _make_parser(json_dict, _worker_args, _worker_pages, _worker_writer, profiler, _worker_names,
+                              collector)
+            jp.run()
+            if not jp.missing_page: # retry texts scraped offline once the page can be fetched
+                output_name = jp.output_name
+        except Exception:
+            print("Couldn't convert {0}:".format(textid))
+            print(traceback.format_exc())
+    return (json_path, log.getvalue(), profiler.to_dict() if profiler else None, output_name,
+            collector.documents if collector else [], _worker_pages.misses[n_misses:])
+
+
+def convert_in_parallel(args, json_paths, jobs, profiler=None, manifest=None, bundle=None, pages=None):
+    """Spreads the conversion of several texts across a pool of processes.
+    The largest JSONs are handed out first so a single huge text doesn't
+    end up running on its own after everything else has finished. Only paths
+    are sent to the workers, which load each text themselves.
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+        json_paths (list (str)): paths of the JSON files to convert
+        jobs (int): number of worker processes
+        profiler (Profiler): collects the timings sent back by the workers, if given
+        manifest (BuildManifest): records every text that got converted, if given
+        bundle (DocxBundle): where to add the docx made by the workers, with --bundle
+        pages (PageCache): gets the pages the workers found missing while offline added to its misses, if given
+    """
+    def source_size(json_path):
+        try:
+            return os.path.getsize(json_path)
+        except OSError:
+            return 0
+
+    json_paths = sorted(json_paths, key=source_size, reverse=True)
+    pool = multiprocessing.Pool(processes=jobs, initializer=_init_worker, initargs=(args,))
+    try:
+        for json_path, log, profile, output_name, documents, misses in pool.imap_unordered(_convert_json_path,
+                                                                                           json_paths, chunksize=1):
+            sys.stdout.write(log)
+            if pages is not None:
+                pages.misses.extend(misses)
+            for document in documents:
+                bundle.add(**document)
+            sys.stdout.flush()
+            if profiler and profile:
+                profiler.merge(profile)
+            if manifest and output_name is not None:
+                manifest.record(json_path, output_name)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _make_parser(json_dict, args, pages, writer, profiler=None, names=None, bundle=None):
+    return JsonParser(json_dict, args.output_directory, pages=pages, writer=writer,
+                      coalesce_runs=not args.no_coalesce, profiler=profiler,
+                      print_text=args.print_text, bracket_stats=args.bracket_stats, names=names, bundle=bundle)
+
+
+def _writer_class(args):
+    if args.format == "docx":
+        return WRITERS[args.writer]
+    return FORMATS[args.format]
+
+
+def _load_json_dict(loader, json_path, profiler=None):
+    if profiler is None:
+        return loader.load_json_dict(json_path)
+    start = profiler.clock()
+    json_dict = loader.load_json_dict(json_path)
+    profiler.add_stage("load", start, json_dict.get("textid", json_path))
+    return json_dict
+
+
+def _converter_version(args):
+    """Identifies everything that decides what a docx looks like besides its
+    inputs: this script's own source and the output options.
+    """
+    sha1 = hashlib.sha1()
+    with open(os.path.abspath(__file__), "rb") as fd:
+        sha1.update(fd.read())
+    sha1.update("{0}/{1}/{2}".format(args.format, args.writer, args.no_coalesce).encode("utf_8"))
+    return sha1.hexdigest()
+
+
+def _make_page_cache(args):
+    return PageCache(args.cache_directory, ttl=args.scrape_cache_ttl * 24 * 60 * 60,
+                     max_bytes=args.scrape_cache_size * 1024 * 1024, offline=args.offline,
+                     base_url=args.oracc_url, concurrency=max(args.scrape_concurrency, 1))
+
+
+def convert_texts(args, loader, json_paths, jobs, profiler=None, force=False, removed=()):
+    """Converts texts into args.output_directory, skipping the ones the
+    output directory's BuildManifest says are current unless force is on,
+    or into a DocxBundle with --bundle.
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+        loader (JsonLoader): to load each text with
+        json_paths (list (str)): paths of the JSON files to convert
+        jobs (int): number of processes to convert with
+        profiler (Profiler): collects stage timings, if given
+        force (bool): convert every text, even unchanged ones
+        removed (list (str)): paths of JSON files that are gone, whose
+            output gets deleted
+    """
+    if args.bundle:
+        # A bundle is written from scratch, so every text goes into it
+        manifest = None
+        bundle = DocxBundle(args.bundle)
+    else:
+        # Only convert texts that are new or changed since the last run into this output directory
+        bundle = None
+        manifest = BuildManifest(args.output_directory, loader.catalogues, _converter_version(args),
+                                 _writer_class(args).EXTENSION)
+        start = Profiler.clock()
+        n_texts = len(json_paths)
+        outdated = []
+        for json_path in json_paths:
+            try:
+                if force or not manifest.is_current(json_path):
+                    outdated.append(json_path)
+            except OSError:  # removed since it was listed, eg. halfway through a git pull
+                print("{0} is gone, skipping it".format(json_path))
+                n_texts -= 1
+        json_paths = outdated
+        if profiler:
+            profiler.add_stage("manifest", start)
+        if len(json_paths) < n_texts:
+            print("Skipping {0} unchanged text(s); use --force to convert them anyway".format(
+                n_texts - len(json_paths)))
+        for json_path in json_paths:
+            manifest.remove_output(json_path)
+        for json_path in removed:
+            manifest.forget(json_path)
+
+    pages = _make_page_cache(args)
+    if args.scrape_concurrency > 0 and not args.offline:
+        start = Profiler.clock()
+        pages.prefetch(find_texts_to_scrape(json_paths, args.stream_json))
+        if profiler:
+            profiler.add_stage("prefetch", start)
+
+    try:
+        if jobs > 1:
+            convert_in_parallel(args, json_paths, jobs, profiler, manifest, bundle, pages)
+        else:
+            writer = _writer_class(args)()
+            names = NameAllocator(args.output_directory)
+            for json_path in json_paths:
+                json_dict = _load_json_dict(loader, json_path, profiler)
+                jp = _make_parser(json_dict, args, pages, writer, profiler, names, bundle)
+                try:
+                    jp.run()
+                except Exception: # eg. a streamed JSON that turns out to be malformed halfway through
+                    print("Couldn't convert {0}:".format(json_dict.get("textid", json_path)))
+                    print(traceback.format_exc())
+                    continue
+                if manifest and jp.output_name is not None and not jp.missing_page:
+                    manifest.record(json_path, jp.output_name)
+                del jp, json_dict # release this text before the next one gets loaded
+
+        if pages.misses:
+            print("{0} ORACC page(s) missing from the cache while offline: {1}".format(
+                len(pages.misses), ", ".join(pages.misses)))
+    except BaseException:
+        if bundle is not None:
+            bundle.discard()
+        raise
+    finally:
+        if manifest is not None:
+            manifest.save()
+    if bundle is not None:
+        bundle.close()
+        print("Saved {0} text(s) in {1}".format(len(bundle.texts), args.bundle))
+
+
+class DirectoryWatcher(object):
+    """
+    Class to notice JSONs being added, changed or removed in a corpusjson
+    directory, and changes to its project's catalogue.json, for --watch.
+    Uses watchdog (inotify and the like) when it's installed, otherwise scans
+    the directory every poll_interval seconds for files whose mtime or size
+    changed.
+    """
+    def __init__(self, directory, poll_interval=WATCH_POLL_INTERVAL):
+        self.directory = os.path.abspath(directory)
+        self.catalogue_path = os.path.join(os.path.dirname(self.directory), "catalogue.json")  # see project_path_for()
+        self.poll_interval = poll_interval
+        self.events = queue.Queue()  # paths from watchdog's thread
+        self.observer = None
+        self.snapshot = None
+        if watchdog is not None:
+            try:
+                observer = watchdog.observers.Observer()
+                observer.schedule(self, self.directory, recursive=False)
+                observer.schedule(self, os.path.dirname(self.directory), recursive=False)
+                observer.start()
+                self.observer = observer
+            except Exception as e:  # eg. out of inotify watches
+                print("Couldn't watch {0} ({1}); polling it instead".format(self.directory, e))
+        if self.observer is None:
+            self.snapshot = self._snapshot()
+
+    # watchdog events that mean a file changed, as opposed to eg. our own reads opening it
+    CHANGE_EVENTS = ("created", "modified", "moved", "deleted", "closed")
+
+    def dispatch(self, event):
+        """Called from watchdog's thread for every file system event.
+        """
+        if event.is_directory or event.event_type not in self.CHANGE_EVENTS:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if path and self._is_watched(os.path.abspath(path)):
+                self.events.put(os.path.abspath(path))
+
+    def wait(self, debounce=WATCH_DEBOUNCE):
+        """Waits until something changes, then until nothing else has
+        changed for debounce seconds, so that a burst of changes (eg. a git
+        pull) is reported in one go.
+        Returns:
+            set (str): absolute paths of the JSONs and catalogue.json that
+                were added, changed or removed
+        """
+        changed = set()
+        while True:
+            paths = self._changes(debounce if changed else self.poll_interval)
+            if changed and not paths:
+                return changed
+            changed |= paths
+
+    def close(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+    def _is_watched(self, path):
+        return path == self.catalogue_path or (os.path.dirname(path) == self.directory and path.endswith(".json"))
+
+    def _changes(self, timeout):
+        """Gets the paths changed within the next timeout seconds or so.
+        """
+        if self.observer is None:
+            time.sleep(min(timeout, self.poll_interval))
+            snapshot = self._snapshot()
+            changed = {path for path in set(snapshot) | set(self.snapshot)
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            return changed
+
+        try:
+            changed = {self.events.get(timeout=timeout)}
+        except queue.Empty:
+            return set()
+        while True:
+            try:
+                changed.add(self.events.get_nowait())
+            except queue.Empty:
+                return changed
+
+    def _snapshot(self):
+        """Gets the mtime and size of every watched file.
+        Returns:
+            dict: path -> (mtime_ns, size)
+        """
+        files = {}
+        for path in glob.glob(os.path.join(glob.escape(self.directory), "*.json")) + [self.catalogue_path]:
+            try:
+                stat = os.stat(path)
+            except OSError:  # eg. removed since it was listed
+                continue
+            files[os.path.abspath(path)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+
+def watch(args, loader, jobs, watcher):
+    """Keeps args.output_directory current with the JSONs in args.file
+    (see --watch) until interrupted: every time a burst of changes settles,
+    the texts they affect are converted again and the output of removed
+    JSONs is deleted. A changed catalogue.json only gets the texts whose
+    entries changed converted again (see BuildManifest). A pass that fails
+    is reported, and watching goes on.
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+        loader (JsonLoader): loader of args.file
+        jobs (int): number of processes to convert with
+        watcher (DirectoryWatcher): watcher of args.file, started before the
+            first conversion so that changes made during it aren't missed
+    """
+    print("Watching {0} for changes{1} (Ctrl+C to stop)".format(
+        watcher.directory, "" if watcher.observer else " every {0}s".format(watcher.poll_interval)))
+    sys.stdout.flush()
+    try:
+        while True:
+            changed = watcher.wait()
+            logger.debug("Changed: %s", ", ".join(sorted(changed)))
+            print("{0} file(s) changed in {1}".format(len(changed), watcher.directory))
+            try:
+                loader.catalogues.refresh()
+                loader.rescan()
+                if watcher.catalogue_path in changed:
+                    json_paths = loader.json_paths
+                else:
+                    json_paths = [json_path for json_path in loader.json_paths
+                                  if os.path.abspath(json_path) in changed]
+                removed = [path for path in changed if path != watcher.catalogue_path and not os.path.exists(path)]
+                convert_texts(args, loader, json_paths, jobs, removed=removed)
+            except Exception:
+                print("Couldn't convert the changes:")
+                print(traceback.format_exc())
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+
+
+_textid_re = re.compile(r"^[A-Za-z0-9_-]+$")
+_project_re = re.compile(r"^[A-Za-z0-9_-]+(/[A-Za-z0-9_-]+)*$")
+
+
+class ConversionService(object):
+    """
+    Class behind --serve: converts single texts on request, keeping what's
+    slow to set up loaded between requests: the catalogue index, page cache
+    and a writer per format, on top of the interpreter and its imports. The
+    docx writers keep their template ready: OoxmlWriter its pre-deflated
+    parts, PythonDocxWriter a loaded document it copies for each request.
+    Texts are looked up by textid in root, a corpusjson directory or the
+    ORACC JSON directory (see find_json_path()).
+    sqlite connections can't be shared between threads, so everything is set
+    up and every text converted on one thread of its own; request threads
+    only hand texts over to it and wait.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.root = os.path.abspath(args.file)
+        self.formats = ["docx"] + sorted(FORMATS)
+        self.converted = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)  # ie. always the same thread
+        self._executor.submit(self._set_up).result()
+
+    def _set_up(self):
+        args = self.args
+        self.catalogues = CatalogueRegistry(args.cache_directory)
+        self.loader = JsonLoader(self.root, lazy=True, catalogues=self.catalogues, stream_cdl=args.stream_json)
+        self.pages = _make_page_cache(args)
+        if WRITERS[args.writer] is PythonDocxWriter:
+            self.writers = {"docx": PythonDocxWriter(keep_template=True)}
+        else:
+            self.writers = {"docx": WRITERS[args.writer]()}
+        self.writers.update((name, writer_class()) for name, writer_class in FORMATS.items())
+
+    def find_json_path(self, textid, project=None):
+        """Finds the JSON of a text: root/textid.json, or
+        root/project/corpusjson/textid.json when project is given. Without
+        one, projects one or two levels down (eg. suhu, saao/saa19) are searched.
+        Args:
+            textid (str): eg. Q003414
+            project (str): eg. rinap/rinap4
+        Returns:
+            str: path to the JSON, or None if there isn't one
+        Raises:
+            ValueError: if textid or project isn't a plain ID, or the textid
+                is in more than one project
+        """
+        if not _textid_re.match(textid) or (project and not _project_re.match(project)):
+            raise ValueError("Invalid textid {0!r} or project {1!r}".format(textid, project))
+        if project:
+            json_path = os.path.join(self.root, project, "corpusjson", textid + ".json")
+            return json_path if os.path.isfile(json_path) else None
+
+        json_path = os.path.join(self.root, textid + ".json")
+        if os.path.isfile(json_path):
+            return json_path
+        root = glob.escape(self.root)
+        json_paths = sorted(glob.glob(os.path.join(root, "*", "corpusjson", textid + ".json")) +
+                            glob.glob(os.path.join(root, "*", "*", "corpusjson", textid + ".json")))
+        if len(json_paths) > 1:
+            raise ValueError("{0} is in more than one project; pick one of {1} with project=".format(
+                textid, ", ".join(os.path.relpath(CatalogueRegistry.project_path_for(path), self.root)
+                                  for path in json_paths)))
+        return json_paths[0] if json_paths else None
+
+    def convert(self, json_path, output_format):
+        """Converts one text, without saving it anywhere.
+        Args:
+            json_path (str): path to an ORACC JSON file
+            output_format (str): one of self.formats
+        Returns:
+            tuple (str, bytes, str): file name the text would be saved as, its
+                contents and their content type, or None if the text has
+                nothing to save
+        Raises:
+            ValueError: if the JSON couldn't be loaded
+        """
+        return self._executor.submit(self._convert, json_path, output_format).result()
+
+    def _convert(self, json_path, output_format):
+        self.catalogues.refresh()  # picks up edited catalogues
+        json_dict = self.loader.load_json_dict(json_path)
+        if not json_dict.get("textid"):
+            raise ValueError("Couldn't load {0}".format(json_path))
+        writer = self.writers[output_format]
+        collector = DocumentCollector()
+        _make_parser(json_dict, self.args, self.pages, writer, bundle=collector).run()
+        self.converted += 1
+        if not collector.documents:
+            return None
+        document = collector.documents[0]
+        return document["prefix"] + document["name"] + document["extension"], document["data"], writer.CONTENT_TYPE
+
+    def status(self):
+        return {
+            "root": self.root,
+            "formats": self.formats,
+            "converted": self.converted,
+        }
+
+    def close(self):
+        self._executor.shutdown()
+
+
+class _ConversionRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handles requests to a ConversionService (as server.service):
+        GET /convert?textid=Q003414[&project=rinap/rinap4][&format=txt]
+    returns the converted text as an attachment (204 if it has nothing to
+    save), and GET /status returns a JSON summary.
+    """
+    def do_GET(self):
+        service = self.server.service
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == "/status":
+            self._send(200, json.dumps(service.status()).encode("utf_8"), "application/json")
+            return
+        if url.path != "/convert":
+            self._send_error(404, "No such path {0}; use /convert?textid=...".format(url.path))
+            return
+
+        output_format = query.get("format", service.args.format)
+        if output_format not in service.formats:
+            self._send_error(400, "Unknown format {0!r}; use one of {1}".format(output_format, ", ".join(service.formats)))
+            return
+        try:
+            json_path = service.find_json_path(query.get("textid", ""), query.get("project"))
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        if json_path is None:
+            self._send_error(404, "No JSON for {0} in {1}".format(query["textid"], service.root))
+            return
+
+        try:
+            document = service.convert(json_path, output_format)
+        except Exception:
+            print("Couldn't convert {0}:".format(json_path))
+            print(traceback.format_exc())
+            self._send_error(500, traceback.format_exc())
+            return
+        if document is None:
+            self._send(204, b"", "text/plain")
+            return
+        file_name, data, content_type = document
+        self._send(200, data, content_type, file_name)
+
+    def _send(self, status, data, content_type, file_name=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if file_name:
+            self.send_header("Content-Disposition", "attachment; filename*=UTF-8''{0}".format(
+                urllib.parse.quote(file_name)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send(status, (message + "\n").encode("utf_8"), "text/plain; charset=utf-8")
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def serve(args, port=SERVE_PORT):
+    """Converts texts on request (see ConversionService) over HTTP on
+    localhost until interrupted.
+    Args:
+        args (argparse.Namespace): parsed command line arguments
+        port (int): port to listen on; 0 picks a free one
+    """
+    service = ConversionService(args)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print("Serving {0} on http://127.0.0.1:{1}/convert?textid=... (Ctrl+C to stop)".format(
+        service.root, server.server_address[1]))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
 def main():
     """
     Parses arguments, determines which mode (json or html) to use.
@@ -1151,18 +3437,87 @@ def main():
                         help='A path (file or directory) to the JSON file to parse into DOCX')
     parser.add_argument('--verbose', '-v', required=False, action="store_true",
                         help='Enable verbose mode during parsing')
+    parser.add_argument('--print-text', required=False, action="store_true",
+                        help="Print each assembled text to the console (without italics or superscripts)")
+    parser.add_argument('--bracket-stats', required=False, action="store_true",
+                        help="Print how many [ ] ⸢ ⸣ each text has, and whether they balance")
     parser.add_argument('--output-directory', '-o', required=False, action="store", default=".",
                         help="Specify directory to output result(s) to. This script will output to the current directory by default.")
+    parser.add_argument('--jobs', '-j', required=False, action="store", type=int, default=1,
+                        help="Number of processes to convert texts with. Defaults to 1 (one text at a time); 0 uses every available CPU.")
+    parser.add_argument('--writer', required=False, action="store", choices=sorted(WRITERS), default="python-docx",
+                        help="How to write the docx files: through python-docx (default), or ooxml to generate the XML directly, which is faster.")
+    parser.add_argument('--format', required=False, action="store", choices=["docx"] + sorted(FORMATS), default="docx",
+                        help="Output format: docx (default), or for previewing and diffing, which is much faster: txt (plain text marking _italic_ and ^superscript^), html, or jsonl (a line of formatted spans per paragraph). Lines and brackets are the same as in the docx.")
+    parser.add_argument('--no-coalesce', required=False, action="store_true",
+                        help="Keep every bracket, delimiter and sign in its own run instead of merging adjacent runs with the same formatting.")
+    parser.add_argument('--cache-directory', required=False, action="store", default=default_cache_directory(),
+                        help="Directory to keep indexed catalogues and scraped ORACC pages in between runs. Defaults to {0}.".format(default_cache_directory()))
+    parser.add_argument('--offline', required=False, action="store_true",
+                        help="Never fetch ORACC pages for incomplete texts; only use already cached ones and report any that are missing.")
+    parser.add_argument('--scrape-cache-ttl', required=False, action="store", type=float, default=30,
+                        help="Days before a cached ORACC page is fetched again. Defaults to 30.")
+    parser.add_argument('--scrape-cache-size', required=False, action="store", type=int, default=256,
+                        help="Megabytes of ORACC pages to keep cached before evicting the least recently used ones. Defaults to 256.")
+    parser.add_argument('--scrape-concurrency', required=False, action="store", type=int, default=8,
+                        help="Number of ORACC pages to prefetch at once before converting. Defaults to 8; 0 disables prefetching.")
+    parser.add_argument('--oracc-url', required=False, action="store", default=ORACC_URL,
+                        help="Base URL to scrape incomplete texts from. Defaults to {0}.".format(ORACC_URL))
+    parser.add_argument('--profile', required=False, action="store", metavar="REPORT",
+                        help="Time every stage, text and node kind, and write a JSON report of the slowest ones to REPORT.")
+    parser.add_argument('--stream-json', required=False, action="store_true",
+                        help="Read each text's cdl incrementally while converting it instead of loading the whole JSON first, so memory use stays flat even for huge texts.")
+    parser.add_argument('--json-backend', required=False, action="store", choices=sorted(JSON_BACKENDS), default=JSON_BACKEND,
+                        help="Library to decode JSON with. Defaults to orjson when it's installed, otherwise json.")
+    parser.add_argument('--bundle', required=False, action="store", metavar="ZIP",
+                        help="Write every docx into this one zip, along with an index.json of each text's member name, docx_lines and ochre_title (see index-gen.py --bundle), instead of separate files in the output directory. Every text is converted.")
+    parser.add_argument('--force', required=False, action="store_true",
+                        help="Convert every text, even ones whose JSON, catalogue entry and converter haven't changed since they were last saved.")
+    parser.add_argument('--serve', required=False, action="store", type=int, nargs="?", const=SERVE_PORT, metavar="PORT",
+                        help="Instead of converting --file, keep running as a local HTTP service that converts single texts from it on request, eg. http://127.0.0.1:PORT/convert?textid=Q003414&format=txt (add project=saao/saa19 when --file is the ORACC JSON directory). Catalogues, caches and writers stay loaded between requests. PORT defaults to {0}.".format(SERVE_PORT))
+    parser.add_argument('--watch', required=False, action="store_true",
+                        help="After converting, keep watching the --file directory and convert texts again within seconds of their JSON or catalogue entry changing (deleting the output of removed JSONs). Uses watchdog when it's installed, otherwise polls.")
     args = parser.parse_args()
 
-    if args.verbose:
-        global VERBOSE_FLAG
-        VERBOSE_FLAG = True
-
-    jl = JsonLoader(args.file)
-    for json_dict in jl.get_json_dicts():
-        jp = JsonParser(json_dict, args.output_directory)
-        jp.run()
+    configure_logging(args.verbose)
+    set_json_backend(args.json_backend)
+
+    if args.watch and (args.bundle or args.serve is not None or not os.path.isdir(args.file)):
+        parser.error("--watch needs --file to be a directory, and can't be used with --bundle or --serve")
+    if args.serve is not None:
+        if not os.path.isdir(args.file):
+            parser.error("--serve needs --file to be a directory")
+        serve(args, args.serve)
+        return
+
+    jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+    profiler = Profiler() if args.profile else None
+
+    # Index any catalogues before forking so the workers don't all rebuild them at once
+    catalogues = CatalogueRegistry(args.cache_directory)
+    jl = JsonLoader(args.file, lazy=True, catalogues=catalogues, stream_cdl=args.stream_json)
+    if jobs > 1:
+        start = Profiler.clock()
+        for project_path in set(CatalogueRegistry.project_path_for(path) for path in jl.json_paths):
+            try:
+                catalogues.ensure_indexed(project_path)
+            except Exception:
+                pass  # reported again per text by the workers
+        if profiler:
+            profiler.add_stage("index", start)
+
+    # Watch from before the first pass, so that files changed while it runs get converted again
+    watcher = DirectoryWatcher(args.file) if args.watch else None
+    try:
+        convert_texts(args, jl, jl.json_paths, jobs, profiler, args.force)
+
+        if profiler:
+            profiler.write_report(args.profile)
+        if watcher is not None:
+            watch(args, jl, jobs, watcher)
+    finally:
+        if watcher is not None:
+            watcher.close()
 
 
 if __name__ == "__main__":